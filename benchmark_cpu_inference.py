@@ -0,0 +1,71 @@
+"""Compares the latency per clip of the local models (Whisper and BLIP) in each inference mode.
+
+Usage: python benchmark_cpu_inference.py <video> [--clips 8] [--clip-duration 3] [--threads N] [--modes default cpu-quantized onnx]
+"""
+
+from pathlib import Path
+import argparse
+import tempfile
+import time
+
+import imageio
+import numpy as np
+from PIL import Image
+
+from konnyaku_gpt.audio import extract_audio_track, PcmAudioTrack
+from konnyaku_gpt.models.cpu_inference import InferenceModes
+from konnyaku_gpt.models.whisper import Whisper
+from konnyaku_gpt.models.blip_large import BlipLarge
+
+
+def measure(call, inputs) -> float:
+    # the first call includes one-off initialization costs
+    call(inputs[0])
+
+    start = time.perf_counter()
+    for x in inputs:
+        call(x)
+
+    return (time.perf_counter() - start) / len(inputs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video', type=Path)
+    parser.add_argument('--clips', type=int, default=8, help='number of clips to run each model on')
+    parser.add_argument('--clip-duration', type=float, default=3.0, help='duration of each clip, in seconds')
+    parser.add_argument('--threads', type=int, default=None, help='number of CPU threads for inference')
+    parser.add_argument('--modes', nargs='+', default=[InferenceModes.DEFAULT, InferenceModes.CPU_QUANTIZED])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        audio_track_path = Path(tmp_dir) / 'audio.f32'
+        extract_audio_track(args.video, audio_track_path)
+        audio_track = PcmAudioTrack(audio_track_path)
+
+        clip_ranges = [(k * args.clip_duration, (k + 1) * args.clip_duration) for k in range(args.clips)]
+        audio_clips = [np.array(audio_track.slice(clip_range)) for clip_range in clip_ranges]
+
+        with imageio.get_reader(args.video) as reader:
+            fps = reader.get_meta_data()['fps']
+            frames = [Image.fromarray(reader.get_data(int(start * fps))) for start, _ in clip_ranges]
+
+    print(f'{"model":<10}{"mode":<16}{"seconds per clip":>18}')
+
+    for mode in args.modes:
+        whisper = Whisper(inference_mode=mode, num_threads=args.threads)
+        latency = measure(lambda samples: whisper.call_array(samples, audio_track.sampling_rate), audio_clips)
+        print(f'{"Whisper":<10}{mode:<16}{latency:>18.3f}')
+        del whisper
+
+        if mode == InferenceModes.ONNX:
+            continue
+
+        blip = BlipLarge(inference_mode=mode, num_threads=args.threads)
+        latency = measure(blip.call, frames)
+        print(f'{"BLIP":<10}{mode:<16}{latency:>18.3f}')
+        del blip
+
+
+if __name__ == '__main__':
+    main()
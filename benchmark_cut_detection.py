@@ -0,0 +1,47 @@
+"""Compares the time of exhaustive and strided cut detection, and whether they find the same cuts.
+
+Usage: python benchmark_cut_detection.py <video> [--strides 4 8 16] [--rtol 0.4] [--engines downscaled-gray full-frame]
+"""
+
+from pathlib import Path
+import argparse
+import time
+
+from konnyaku_gpt.frame_difference import DownscaledGrayDifferenceEngine, FullFrameDifferenceEngine
+from konnyaku_gpt.utils import compute_frame_differences, clip_ranges_from_frame_differences, STRIDED_REFINE_MARGIN
+
+ENGINES = {
+    'downscaled-gray': DownscaledGrayDifferenceEngine,
+    'full-frame': FullFrameDifferenceEngine,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video', type=Path)
+    parser.add_argument('--strides', type=int, nargs='+', default=[4, 8, 16])
+    parser.add_argument('--rtol', type=float, default=0.4, help='the rtol used to compare the cuts (as in `split_video`)')
+    parser.add_argument('--engines', nargs='+', default=list(ENGINES.keys()), choices=list(ENGINES.keys()))
+    args = parser.parse_args()
+
+    print(f'{"engine":<18}{"stride":>8}{"seconds":>10}{"clips":>8}{"same cuts":>11}')
+
+    for engine_name in args.engines:
+        engine = ENGINES[engine_name]()
+
+        start = time.perf_counter()
+        differences, fps = compute_frame_differences(args.video, engine)
+        exhaustive_time = time.perf_counter() - start
+        exhaustive_ranges = clip_ranges_from_frame_differences(differences, fps, args.rtol)
+        print(f'{engine_name:<18}{1:>8}{exhaustive_time:>10.2f}{len(exhaustive_ranges):>8}{"-":>11}')
+
+        for stride in args.strides:
+            start = time.perf_counter()
+            differences, fps = compute_frame_differences(args.video, engine, stride=stride, refine_rtol=args.rtol * STRIDED_REFINE_MARGIN)
+            strided_time = time.perf_counter() - start
+            ranges = clip_ranges_from_frame_differences(differences, fps, args.rtol)
+            print(f'{engine_name:<18}{stride:>8}{strided_time:>10.2f}{len(ranges):>8}{str(ranges == exhaustive_ranges):>11}')
+
+
+if __name__ == '__main__':
+    main()
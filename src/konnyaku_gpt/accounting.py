@@ -0,0 +1,157 @@
+"""Thread-safe accounting of the tokens, cost, latency and retries of LLM requests, per model and per pipeline stage."""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, fields, asdict
+from pathlib import Path
+from typing import Dict, Tuple, Iterator, Any
+import json
+import threading
+
+# the stage of requests made outside any `llm_stage`
+UNSPECIFIED_STAGE = 'unspecified'
+# the model of retries of layers above models (e.g., a corrector retrying an unparsable output)
+ANY_MODEL = 'any'
+
+_current_stage: ContextVar[str] = ContextVar('current_llm_stage', default=UNSPECIFIED_STAGE)
+
+
+@contextmanager
+def llm_stage(name: str) -> Iterator[None]:
+    """Attributes the LLM requests made within the scope (including those in asyncio tasks and `asyncio.to_thread`) to a pipeline stage.
+
+    Args:
+        name (str): The name of the stage, e.g., "plot-analysis".
+    """
+
+    token = _current_stage.set(name)
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)
+
+
+def current_llm_stage() -> str:
+    return _current_stage.get()
+
+
+@dataclass
+class UsageRecord:
+    """The usage of a model in a stage."""
+
+    # requests sent to the model, including failed ones
+    requests: int = 0
+    failed_requests: int = 0
+    # retries decided by `RetryPolicy` (of any layer)
+    retries: int = 0
+    cache_hits: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    # in dollars
+    cost: float = 0.0
+    # the wall time of the requests (including failed ones) and the time spent waiting for the rate limiter, in seconds
+    latency: float = 0.0
+    rate_limit_wait: float = 0.0
+
+    def __add__(self, other: 'UsageRecord') -> 'UsageRecord':
+        return UsageRecord(**{f.name: getattr(self, f.name) + getattr(other, f.name) for f in fields(self)})
+
+    def __sub__(self, other: 'UsageRecord') -> 'UsageRecord':
+        return UsageRecord(**{f.name: getattr(self, f.name) - getattr(other, f.name) for f in fields(self)})
+
+
+class UsageAccountant:
+    """Records the usage of LLMs per (model, stage). All methods are thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # {(model name, stage): usage}
+        self._records: Dict[Tuple[str, str], UsageRecord] = {}
+        # running totals over all stages, {model name: usage}
+        self._totals_by_model: Dict[str, UsageRecord] = {}
+        self._total_cost = 0.0
+
+    def _record(self, model_name: str, **increments: Any) -> None:
+        key = (model_name, current_llm_stage())
+
+        with self._lock:
+            record = self._records.setdefault(key, UsageRecord())
+            total = self._totals_by_model.setdefault(model_name, UsageRecord())
+
+            for name, increment in increments.items():
+                setattr(record, name, getattr(record, name) + increment)
+                setattr(total, name, getattr(total, name) + increment)
+
+            self._total_cost += increments.get('cost', 0.0)
+
+    def record_request(self, model_name: str, input_tokens: int, output_tokens: int, cost: float, latency: float, rate_limit_wait: float) -> None:
+        """Records a completed request in the current stage."""
+
+        self._record(model_name, requests=1, input_tokens=input_tokens, output_tokens=output_tokens, cost=cost,
+                     latency=latency, rate_limit_wait=rate_limit_wait)
+
+    def record_failed_request(self, model_name: str, latency: float, rate_limit_wait: float) -> None:
+        """Records a request that failed (e.g., was rate-limited) in the current stage."""
+
+        self._record(model_name, requests=1, failed_requests=1, latency=latency, rate_limit_wait=rate_limit_wait)
+
+    def record_retry(self, model_name: str) -> None:
+        """Records a retry in the current stage; `ANY_MODEL` for retries of layers above models."""
+
+        self._record(model_name, retries=1)
+
+    def record_cache_hit(self, model_name: str) -> None:
+        self._record(model_name, cache_hits=1)
+
+    @property
+    def total_cost(self) -> float:
+        """The cost of all models so far, in dollars."""
+
+        return self._total_cost
+
+    def totals_by_model(self) -> Dict[str, UsageRecord]:
+        """Returns a copy of the usage so far over all stages, as {model name: usage}."""
+
+        with self._lock:
+            return {model_name: UsageRecord(**asdict(record)) for model_name, record in self._totals_by_model.items()}
+
+    def snapshot(self) -> Dict[Tuple[str, str], UsageRecord]:
+        """Returns a copy of the usage so far, as {(model name, stage): usage}."""
+
+        with self._lock:
+            return {key: UsageRecord(**asdict(record)) for key, record in self._records.items()}
+
+    def snapshot_since(self, earlier: Dict[Tuple[str, str], UsageRecord]) -> Dict[Tuple[str, str], UsageRecord]:
+        """Returns the usage since an earlier snapshot (e.g., that at the start of an episode)."""
+
+        return {key: record - earlier.get(key, UsageRecord()) for key, record in self.snapshot().items()}
+
+
+def summarize_usage(records: Dict[Tuple[str, str], UsageRecord]) -> Dict[str, Any]:
+    """Summarizes a usage snapshot into a JSON-serializable report, with totals per model, per stage, and overall."""
+
+    by_model: Dict[str, UsageRecord] = {}
+    by_stage: Dict[str, UsageRecord] = {}
+    total = UsageRecord()
+
+    for (model_name, stage), record in records.items():
+        by_model[model_name] = by_model.get(model_name, UsageRecord()) + record
+        by_stage[stage] = by_stage.get(stage, UsageRecord()) + record
+        total = total + record
+
+    return {
+        'total': asdict(total),
+        'by_model': {name: asdict(record) for name, record in by_model.items()},
+        'by_stage': {name: asdict(record) for name, record in by_stage.items()},
+        'by_model_and_stage': [
+            {'model': model_name, 'stage': stage, **asdict(record)}
+            for (model_name, stage), record in records.items()
+        ],
+    }
+
+
+def dump_usage_report(records: Dict[Tuple[str, str], UsageRecord], path: Path) -> None:
+    """Writes the summary of a usage snapshot to a JSON file."""
+
+    with open(path, 'w') as f:
+        json.dump(summarize_usage(records), f, indent=4)
@@ -0,0 +1,178 @@
+"""Decoding of audio tracks into raw PCM files, which are memory-mapped for transcription."""
+
+from pathlib import Path
+from typing import Tuple, Sequence
+import io
+import os
+import wave
+import logging
+import subprocess
+import numpy as np
+import imageio_ffmpeg
+
+# the sampling rate expected by ASR models
+ASR_SAMPLING_RATE = 16000
+# audio frames quieter than this (in dB relative to full scale) are considered silent
+DEFAULT_SILENCE_THRESHOLD_DB = -45.0
+
+
+def extract_audio_track(video_path: Path, output_path: Path, sampling_rate: int=ASR_SAMPLING_RATE) -> None:
+    """Decodes the (first) audio track of a video into a raw mono float32 PCM file.
+
+    The file is written under a temporary name and renamed when complete, so an existing `output_path` is always complete.
+
+    Args:
+        video_path (Path): The path to the video.
+        output_path (Path): The output file path.
+        sampling_rate (int, optional): The sampling rate to resample the audio to. Defaults to `ASR_SAMPLING_RATE`.
+    """
+
+    tmp_path = output_path.with_name(output_path.name + '.tmp')
+
+    subprocess.run([imageio_ffmpeg.get_ffmpeg_exe(), '-nostdin', '-loglevel', 'error', '-y',
+                    '-i', str(video_path), '-map', '0:a:0', '-ac', '1', '-ar', str(sampling_rate),
+                    '-f', 'f32le', '-c:a', 'pcm_f32le', str(tmp_path)],
+                   check=True, stdout=subprocess.DEVNULL)
+
+    os.replace(tmp_path, output_path)
+
+
+class PcmAudioTrack:
+    """A raw mono float32 PCM file (see `extract_audio_track`), memory-mapped so that clips can be sliced without copying.
+    """
+
+    def __init__(self, path: Path, sampling_rate: int=ASR_SAMPLING_RATE):
+        """Constructor.
+
+        Args:
+            path (Path): The path to the PCM file.
+            sampling_rate (int, optional): The sampling rate of the PCM file. Defaults to `ASR_SAMPLING_RATE`.
+        """
+
+        self.path = path
+        self.sampling_rate = sampling_rate
+
+        # empty files cannot be memory-mapped
+        if os.path.getsize(path) > 0:
+            self.samples: np.ndarray = np.memmap(path, dtype=np.float32, mode='r')
+        else:
+            self.samples = np.zeros(0, dtype=np.float32)
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / self.sampling_rate
+
+    def slice(self, time_range: Tuple[float, float]) -> np.ndarray:
+        """Gets the samples in a time range (in seconds) as a read-only view of the file."""
+
+        start, end = time_range
+        start_index = max(0, round(start * self.sampling_rate))
+        end_index = min(len(self.samples), round(end * self.sampling_rate))
+
+        return self.samples[start_index:max(start_index, end_index)]
+
+
+def write_wav(path: Path | io.BytesIO, samples: np.ndarray, sampling_rate: int) -> None:
+    """Writes mono float samples (in [-1, 1]) into a 16-bit PCM wav file (or an in-memory buffer)."""
+
+    pcm = (np.clip(samples, -1, 1) * 32767).astype('<i2')
+
+    with wave.open(str(path) if isinstance(path, Path) else path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sampling_rate)
+        f.writeframes(pcm.tobytes())
+
+
+def decode_audio(source: Path | bytes, sampling_rate: int=ASR_SAMPLING_RATE) -> np.ndarray:
+    """Decodes an audio file (or the bytes of one) into mono float32 samples.
+
+    Args:
+        source (Path | bytes): The path to the file, or its content.
+        sampling_rate (int, optional): The sampling rate to resample the audio to. Defaults to `ASR_SAMPLING_RATE`.
+
+    Returns:
+        np.ndarray: The samples.
+    """
+
+    if isinstance(source, Path):
+        input_args, input_data = ['-nostdin', '-i', str(source)], None
+    else:
+        input_args, input_data = ['-i', 'pipe:0'], source
+
+    result = subprocess.run([imageio_ffmpeg.get_ffmpeg_exe(), '-loglevel', 'error', *input_args,
+                             '-map', '0:a:0', '-ac', '1', '-ar', str(sampling_rate), '-f', 'f32le', 'pipe:1'],
+                            input=input_data, capture_output=True, check=True)
+
+    return np.frombuffer(result.stdout, dtype=np.float32)
+
+
+def encode_compact_audio(samples: np.ndarray, sampling_rate: int, bitrate: str='24k') -> Tuple[bytes, str]:
+    """Encodes mono float samples into a small in-memory file for uploading, without touching the disk.
+
+    Opus at a low bitrate is used; a wav file is produced instead if ffmpeg cannot encode Opus.
+
+    Args:
+        samples (np.ndarray): The float samples, in [-1, 1].
+        sampling_rate (int): The sampling rate of the samples.
+        bitrate (str, optional): The Opus bitrate, in ffmpeg's notation. Defaults to '24k'.
+
+    Returns:
+        Tuple[bytes, str]: The content of the file and its extension (e.g., '.ogg').
+    """
+
+    pcm = np.ascontiguousarray(samples, dtype=np.float32).tobytes()
+
+    try:
+        result = subprocess.run([imageio_ffmpeg.get_ffmpeg_exe(), '-loglevel', 'error',
+                                 '-f', 'f32le', '-ar', str(sampling_rate), '-ac', '1', '-i', 'pipe:0',
+                                 '-c:a', 'libopus', '-b:a', bitrate, '-application', 'voip', '-f', 'ogg', 'pipe:1'],
+                                input=pcm, capture_output=True, check=True)
+        return result.stdout, '.ogg'
+    except subprocess.CalledProcessError as e:
+        logging.warning(f'Failed to encode audio with Opus ({e.stderr.decode(errors="replace").strip()}); falling back to wav.')
+
+    buffer = io.BytesIO()
+    write_wav(buffer, samples, sampling_rate)
+
+    return buffer.getvalue(), '.wav'
+
+
+def detect_silent_clips(audio_track: PcmAudioTrack, clip_ranges: Sequence[Tuple[float, float]], threshold_db: float=DEFAULT_SILENCE_THRESHOLD_DB,
+                        frame_duration: float=0.02, min_voiced_duration: float=0.1) -> np.ndarray:
+    """Finds the clips that contain no sound by the energy of their audio.
+
+    The energy of each audio frame of the whole track is computed at once,
+    then a clip is silent if less than `min_voiced_duration` seconds of its frames are louder than `threshold_db`.
+
+    Args:
+        audio_track (PcmAudioTrack): The audio track of the video.
+        clip_ranges (Sequence[Tuple[float, float]]): The time ranges of the clips, in seconds.
+        threshold_db (float, optional): The energy (in dB relative to full scale) above which a frame is voiced.
+            Defaults to `DEFAULT_SILENCE_THRESHOLD_DB`.
+        frame_duration (float, optional): The duration of an audio frame, in seconds. Defaults to 0.02.
+        min_voiced_duration (float, optional): The minimum voiced duration of a clip which is not silent, in seconds. Defaults to 0.1.
+
+    Returns:
+        np.ndarray: Whether each clip is silent (bool).
+    """
+
+    frame_length = max(1, round(frame_duration * audio_track.sampling_rate))
+    frame_duration = frame_length / audio_track.sampling_rate
+    n_frames = len(audio_track.samples) // frame_length
+
+    frames = np.asarray(audio_track.samples[:n_frames * frame_length]).reshape(n_frames, frame_length)
+    # mean square of each frame without materializing the squared samples
+    energies = np.einsum('ij,ij->i', frames, frames) / frame_length
+    voiced = 10 * np.log10(energies + 1e-12) > threshold_db
+
+    # number of voiced frames before each frame
+    voiced_before = np.concatenate([[0], np.cumsum(voiced)])
+
+    ranges = np.array(clip_ranges, dtype=np.float64).reshape(-1, 2)
+    first_frames = np.clip(np.floor(ranges[:, 0] / frame_duration).astype(int), 0, n_frames)
+    end_frames = np.clip(np.ceil(ranges[:, 1] / frame_duration).astype(int), first_frames, n_frames)
+
+    voiced_durations = (voiced_before[end_frames] - voiced_before[first_frames]) * frame_duration
+
+    return voiced_durations < min_voiced_duration
@@ -0,0 +1,114 @@
+"""A persistent key-value cache for model outputs, stored in SQLite."""
+
+from pathlib import Path
+from typing import Self
+import hashlib
+import sqlite3
+import threading
+import time
+
+# the default maximum total size of the cached entries, in bytes
+DEFAULT_CACHE_MAX_SIZE = 256 * 1024 * 1024
+
+
+class ContentCache:
+    """Maps content keys (e.g., hashes of model inputs) to strings, evicting the least recently used entries beyond a size limit.
+
+    The cache can be shared by several runs (e.g., all episodes of a series) and by several threads.
+    """
+
+    def __init__(self, path: Path, max_size: int=DEFAULT_CACHE_MAX_SIZE):
+        """Constructor.
+
+        Args:
+            path (Path): The SQLite database file. Created if it does not exist.
+            max_size (int, optional): The maximum total size of the keys and values, in bytes.
+                Defaults to `DEFAULT_CACHE_MAX_SIZE`.
+        """
+
+        assert max_size > 0, f'max_size must be positive, but got {max_size}!'
+
+        self.path = path
+        self.max_size = max_size
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(path), check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS entries '
+                                 '(key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)')
+        self._connection.execute('CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)')
+        self._connection.commit()
+
+        self._size: int = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+        # the numbers of `get` calls that found and did not find the key, respectively
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(*parts: bytes | str) -> str:
+        """Hashes some parts (e.g., a model name and the bytes of an input) into a key."""
+
+        digest = hashlib.sha256()
+
+        for part in parts:
+            data = part.encode('utf-8') if isinstance(part, str) else part
+            # length prefixes keep ('ab', 'c') and ('a', 'bc') apart
+            digest.update(len(data).to_bytes(8, 'little'))
+            digest.update(data)
+
+        return digest.hexdigest()
+
+    def get(self, key: str) -> str | None:
+        """Gets the value of a key, or None if it is not cached."""
+
+        with self._lock:
+            row = self._connection.execute('SELECT value FROM entries WHERE key = ?', (key,)).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._connection.execute('UPDATE entries SET last_access = ? WHERE key = ?', (time.time(), key))
+            self._connection.commit()
+
+        return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        """Caches the value of a key, evicting the least recently used entries if the cache becomes too large."""
+
+        size = len(key) + len(value.encode('utf-8'))
+
+        with self._lock:
+            old = self._connection.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+            if old is not None:
+                self._size -= old[0]
+
+            self._connection.execute('INSERT OR REPLACE INTO entries (key, value, size, last_access) VALUES (?, ?, ?, ?)',
+                                     (key, value, size, time.time()))
+            self._size += size
+
+            while self._size > self.max_size:
+                oldest = self._connection.execute('SELECT key, size FROM entries ORDER BY last_access LIMIT 1').fetchone()
+                if oldest is None:
+                    break
+
+                self._connection.execute('DELETE FROM entries WHERE key = ?', (oldest[0],))
+                self._size -= oldest[1]
+
+            self._connection.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
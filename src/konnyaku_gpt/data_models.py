@@ -1,5 +1,5 @@
 from typing import Self, Dict, List, Tuple
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
 from abc import ABC, abstractmethod
 import json
@@ -45,25 +45,33 @@ class ClipMetaData(JsonSerializable):
     """`clip_range` is in seconds.
     
     `index` starts from 0.
+    
+    `path` is None for virtual clips, i.e., clips that are read directly from the source video.
+    
+    `representative_frames` are images of the clip saved by the splitter (the first one is the first frame of the clip).
+    Like `path`, they are relative to the directory of the clips.
     """
 
     index: int
-    path: Path
+    path: Path | None
     clip_range: Tuple[float, float]
+    representative_frames: List[Path] = field(default_factory=list)
 
     def as_pytree(self) -> str:
         return {
             'index': self.index,
-            'path': str(self.path),
-            'clip_range': list(self.clip_range)
+            'path': str(self.path) if self.path is not None else None,
+            'clip_range': list(self.clip_range),
+            'representative_frames': [str(frame_path) for frame_path in self.representative_frames]
         }
     
     @staticmethod
     def from_pytree(data: Dict) -> Self:
         return ClipMetaData(
             index=data['index'],
-            path=Path(data['path']),
-            clip_range=tuple(data['clip_range'])
+            path=Path(data['path']) if data['path'] is not None else None,
+            clip_range=tuple(data['clip_range']),
+            representative_frames=[Path(frame_path) for frame_path in data.get('representative_frames', [])]
         )
     
     def to_json(self) -> str:
@@ -80,11 +88,26 @@ class ClipMetaData(JsonSerializable):
 
 @dataclass
 class ClipSetMetadata(JsonSerializable):
+    """`source_video_path` is the video that virtual clips are read from; None if all clips have their own files.
+    """
+
     clips_metadata: List[ClipMetaData]
+    source_video_path: Path | None = None
 
     def to_json(self) -> str:
-        return json.dumps([item.as_pytree() for item in self.clips_metadata], indent=4)
+        clips_pytree = [item.as_pytree() for item in self.clips_metadata]
+
+        if self.source_video_path is None:
+            return json.dumps(clips_pytree, indent=4)
+        else:
+            return json.dumps({'source_video_path': str(self.source_video_path), 'clips_metadata': clips_pytree}, indent=4)
     
     @staticmethod
     def from_json(json_data: str) -> Self:
-        return ClipSetMetadata([ClipMetaData.from_pytree(item) for item in json.loads(json_data)])
+        data = json.loads(json_data)
+
+        if isinstance(data, List):
+            return ClipSetMetadata([ClipMetaData.from_pytree(item) for item in data])
+        else:
+            return ClipSetMetadata([ClipMetaData.from_pytree(item) for item in data['clips_metadata']],
+                                   source_video_path=Path(data['source_video_path']))
@@ -0,0 +1,140 @@
+"""Engines which compute the relative difference between consecutive video frames (used for scene-cut detection)."""
+
+from abc import ABC, abstractmethod
+from typing import Tuple
+import numpy as np
+
+
+class FrameDifferenceEngine(ABC):
+    """Computes the relative difference between consecutive frames of a video.
+
+    The relative difference between two frames, `A`, `B` is calculated as
+    `|A - B| / (|A| + |B|)`, which is always between 0 and 1 for real matrices.
+
+    Engines are stateful: `push` compares the pushed frame with the previously pushed one,
+    so that the norm of each frame is computed only once.
+    
+    `decode_width` and `decode_gray` describe the smallest frames an engine can work on,
+    so that frame readers can deliver frames in that form directly.
+    """
+
+    # None means the original resolution
+    decode_width: int | None = None
+    decode_gray: bool = False
+
+    def __init__(self):
+        self._last_frame: np.ndarray | None = None
+        self._last_norm: float = 0
+
+    @abstractmethod
+    def prepare(self, frame: np.ndarray) -> np.ndarray:
+        """Converts a decoded frame into the representation used for comparison.
+
+        The returned array MUST NOT share memory with `frame`, as frame readers may reuse their buffers.
+
+        Args:
+            frame (np.ndarray): The decoded frame, either (height, width, channel) or (height, width).
+
+        Returns:
+            np.ndarray: A floating-point array.
+        """
+
+        raise NotImplementedError()
+
+    @staticmethod
+    def norm(x: np.ndarray) -> float:
+        flat = x.ravel()
+        return float(np.sqrt(np.dot(flat, flat)))
+
+    @staticmethod
+    def relative_difference(frame1: np.ndarray, norm1: float, frame2: np.ndarray, norm2: float) -> float:
+        """Computes the relative difference between two prepared frames whose norms are known.
+
+        Two all-zero frames are considered identical.
+        """
+
+        if norm1 + norm2 == 0:
+            return 0.0
+
+        return FrameDifferenceEngine.norm(frame1 - frame2) / (norm1 + norm2)
+
+    def reset(self) -> None:
+        """Forgets the previously pushed frame."""
+
+        self._last_frame = None
+        self._last_norm = 0
+
+    def save_state(self) -> Tuple[np.ndarray | None, float]:
+        """Returns the previously pushed frame (prepared) and its norm, so that comparisons can resume from it with `restore_state`."""
+
+        return self._last_frame, self._last_norm
+
+    def restore_state(self, state: Tuple[np.ndarray | None, float]) -> None:
+        self._last_frame, self._last_norm = state
+
+    def push(self, frame: np.ndarray) -> float:
+        """Compares a frame with the previously pushed frame.
+
+        Args:
+            frame (np.ndarray): The decoded frame.
+
+        Returns:
+            float: The relative difference. 0 if this is the first frame pushed.
+        """
+
+        prepared = self.prepare(frame)
+        norm = self.norm(prepared)
+
+        if self._last_frame is None:
+            diff = 0.0
+        else:
+            diff = self.relative_difference(self._last_frame, self._last_norm, prepared, norm)
+
+        self._last_frame, self._last_norm = prepared, norm
+
+        return diff
+
+
+class FullFrameDifferenceEngine(FrameDifferenceEngine):
+    """Compares full-resolution frames in float32 (the original behavior of `split_video`, minus the uint8 overflow)."""
+
+    # override
+    def prepare(self, frame: np.ndarray) -> np.ndarray:
+        return frame.astype(np.float32)
+
+
+class DownscaledGrayDifferenceEngine(FrameDifferenceEngine):
+    """Compares downscaled grayscale versions of the frames.
+
+    Frames are subsampled with a constant stride so that they are at most `target_width` pixels wide
+    before being converted to grayscale, hence the cost per frame is almost independent of the video resolution.
+    """
+
+    # ITU-R BT.601 luma weights
+    _luma_weights = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+    def __init__(self, target_width: int=160):
+        """Constructor.
+
+        Args:
+            target_width (int, optional): The maximum width of the frames being compared. Defaults to 160.
+        """
+
+        super().__init__()
+
+        assert target_width >= 1, f'target_width must be positive, but got {target_width}!'
+
+        self.target_width = target_width
+        self.decode_width = target_width
+        self.decode_gray = True
+
+    # override
+    def prepare(self, frame: np.ndarray) -> np.ndarray:
+        stride = max(1, -(-frame.shape[1] // self.target_width))
+        small = frame[::stride, ::stride]
+
+        if small.ndim == 3:
+            # the matrix product allocates a new array
+            return small[..., :3] @ self._luma_weights
+        else:
+            return small.astype(np.float32)
@@ -0,0 +1,151 @@
+"""A video frame reader that decodes frames with ffmpeg into a reused buffer."""
+
+from pathlib import Path
+from typing import Iterator, List, Tuple
+import subprocess
+import numpy as np
+import imageio_ffmpeg
+
+
+class FfmpegFrameReader:
+    """Reads the frames of a video from an ffmpeg rawvideo pipe.
+
+    Every frame is read into the same preallocated buffer, so no memory is allocated per frame.
+    Consequently, a yielded frame is only valid until the next frame is read; copy it if it needs to be kept.
+
+    ffmpeg's scale and format filters can be used so that decoding already delivers small (and grayscale) frames.
+    """
+
+    def __init__(self, video_path: Path, width: int | None=None, gray: bool=False, start_frame: int=0):
+        """Constructor.
+
+        Args:
+            video_path (Path): The path to the video.
+            width (int | None, optional): The width of the frames to deliver; the aspect ratio is kept.
+                Frames are never upscaled. "None" means the original resolution. Defaults to None.
+            gray (bool, optional): Whether to deliver grayscale frames of shape (height, width)
+                instead of RGB frames of shape (height, width, 3). Defaults to False.
+            start_frame (int, optional): The index of the first frame to deliver.
+                ffmpeg seeks to it instead of decoding the video from the beginning. Defaults to 0.
+        """
+
+        self.video_path = video_path
+        self.gray = gray
+        self.start_frame = start_frame
+
+        # the first item yielded by imageio-ffmpeg is the metadata of the video
+        metadata_reader = imageio_ffmpeg.read_frames(str(video_path))
+        metadata = next(metadata_reader)
+        metadata_reader.close()
+
+        self.fps: float = metadata['fps']
+        self.duration: float = metadata['duration']
+        self.codec: str = metadata['codec']
+        self.source_size: Tuple[int, int] = tuple(metadata['size'])
+
+        source_width, source_height = self.source_size
+        if width is None or width >= source_width:
+            self.size = self.source_size
+        else:
+            self.size = (width, max(1, round(source_height * width / source_width)))
+
+        self._process: subprocess.Popen | None = None
+
+    @property
+    def n_frames(self) -> float:
+        """The (estimated) number of frames in the video, including those before `start_frame`."""
+
+        return self.duration * self.fps
+
+    @property
+    def frame_shape(self) -> Tuple[int, ...]:
+        width, height = self.size
+        return (height, width) if self.gray else (height, width, 3)
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        filters = [] if self.size == self.source_size else ['-vf', f'scale={self.size[0]}:{self.size[1]}:flags=area']
+
+        yield from self._read([*filters, '-pix_fmt', 'gray' if self.gray else 'rgb24'], self.frame_shape)
+
+    def iter_with_scaled(self, width: int | None, gray: bool) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """Reads each frame together with a scaled (and grayscale) version of it, decoding the video only once.
+
+        The scaled frames are the same as those delivered by a reader constructed with `width` and `gray`.
+        Both frames of a pair are views of the same buffer, and are only valid until the next pair is read.
+
+        Args:
+            width (int | None): The width of the scaled frames, as in the constructor.
+            gray (bool): Whether the scaled frames are grayscale, as in the constructor.
+        """
+
+        assert not self.gray, 'Only RGB frames can be read with scaled frames!'
+
+        source_width, source_height = self.source_size
+        scaled_width, scaled_height = self.size if width is None or width >= source_width \
+            else (width, max(1, round(source_height * width / source_width)))
+        width, height = self.size
+
+        # the scaled frame is padded (as RGB) and stacked below the frame, so that both come through one pipe
+        main_filters = [] if self.size == self.source_size else [f'scale={width}:{height}:flags=area']
+        scaled_filters = [] if (scaled_width, scaled_height) == self.source_size else [f'scale={scaled_width}:{scaled_height}:flags=area']
+        if gray:
+            scaled_filters.append('format=gray')
+        filter_graph = (f'[0:v]split=2[main][scaled];'
+                        f'[main]{",".join([*main_filters, "format=rgb24"])}[main_rgb];'
+                        f'[scaled]{",".join([*scaled_filters, "format=rgb24", f"pad={width}:{scaled_height}"])}[scaled_rgb];'
+                        f'[main_rgb][scaled_rgb]vstack')
+
+        for stacked in self._read(['-filter_complex', filter_graph, '-pix_fmt', 'rgb24'], (height + scaled_height, width, 3)):
+            scaled = stacked[height:, :scaled_width]
+            yield stacked[:height], scaled[..., 0] if gray else scaled
+
+    def _read(self, output_args: List[str], frame_shape: Tuple[int, ...]) -> Iterator[np.ndarray]:
+        self.close()
+
+        # frames before the seek position are decoded but dropped by ffmpeg;
+        # seek slightly before the start frame so that rounding errors cannot drop it
+        # (seeking further back would make ffmpeg duplicate the start frame to keep a constant frame rate)
+        seek = ['-ss', f'{(self.start_frame - 0.01) / self.fps:.6f}'] if self.start_frame > 0 else []
+
+        self._process = subprocess.Popen(
+            [imageio_ffmpeg.get_ffmpeg_exe(), '-nostdin', '-loglevel', 'error',
+             *seek, '-i', str(self.video_path), *output_args,
+             '-f', 'rawvideo', 'pipe:1'],
+            stdout=subprocess.PIPE, bufsize=0
+        )
+
+        buffer = bytearray(int(np.prod(frame_shape)))
+        buffer_view = memoryview(buffer)
+        frame = np.frombuffer(buffer, dtype=np.uint8).reshape(frame_shape)
+
+        try:
+            while True:
+                # an unbuffered pipe delivers at most its capacity on each read
+                n_read = 0
+                while n_read < len(buffer):
+                    n = self._process.stdout.readinto(buffer_view[n_read:])
+                    if not n:
+                        break
+                    n_read += n
+
+                if n_read < len(buffer):
+                    break
+
+                yield frame
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self._process is not None:
+            self._process.stdout.close()
+            # ffmpeg only handles SIGTERM between frames, so it would hang if it is blocked writing to a pipe
+            # whose read end is still open (e.g., inherited by worker processes forked in the meantime)
+            self._process.kill()
+            self._process.wait()
+            self._process = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -6,6 +6,7 @@ from pathlib import Path
 from ..data_models import ClipData
 from .many_clips_transcription_corrector import ManyClipsTranscriptionCorrector
 from ..transcription_correction.transcription_corrector import TranscriptionCorrector
+from ..retry_policy import RetryPolicy, ErrorKinds, policy_from_deprecated_count
 
 
 class ManyClipsBatchedCorrector(ManyClipsTranscriptionCorrector):
@@ -14,20 +15,31 @@ class ManyClipsBatchedCorrector(ManyClipsTranscriptionCorrector):
     grouping them into batches (batches may intersect) and applying another "group corrector" for each batch.
     
     Since this corrector deals with large number of clips, a caching mechanism is added so that correction operation can be paused and resumed.
+    
+    If the output for a batch hits the length limit of the model, the target clips are split in halves that are corrected separately.
     """
     
-    def __init__(self, group_corrector: TranscriptionCorrector, max_retry_count: int=3) -> None:
+    def __init__(self, group_corrector: TranscriptionCorrector, retry_policy: RetryPolicy | None=None, max_retry_count: int | None=None) -> None:
         """Constructor.
 
         Args:
             group_corrector (TranscriptionCorrector): The group corrector that will be applied to each batch.
-            max_retry_count (int): The maximum number to retry on each group of clips. If reached, the clip group will be skipped and no transcription will be produced.
+            retry_policy (RetryPolicy | None): The retry policy whose per-group and per-run budgets bound the retries of all layers (group corrector, models).
+                Pass the same policy to the group corrector and its models. If a group still fails, it is skipped and no transcription will be produced.
+                "None" means a default policy.
+            max_retry_count (int | None): Deprecated; the maximum number of tries on each group of clips.
+                Equivalent to `retry_policy=RetryPolicy(max_retries_per_group=max_retry_count - 1)`.
         """
         
         super().__init__()
         
         self.group_corrector = group_corrector
-        self.max_retry_count = max_retry_count
+        assert retry_policy is None or max_retry_count is None, 'Pass either retry_policy or the deprecated max_retry_count, not both!'
+
+        if max_retry_count is not None:
+            retry_policy = policy_from_deprecated_count('max_retry_count', max_retries_per_group=max_retry_count - 1)
+
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
     
     # override
     def correct_transcriptions(self,
@@ -144,56 +156,52 @@ class ManyClipsBatchedCorrector(ManyClipsTranscriptionCorrector):
 
         total_unprocessed_groups = len(unprocessed_groups)
 
-        while len(unprocessed_groups) > 0:
-            logging.info(f'{len(unprocessed_groups)}/{total_unprocessed_groups} groups remaining')
-            # get group to be processed
-            group_index = next(iter(unprocessed_groups))
-            group = groups[group_index]
-            start_index, context_pre_clip_count, target_clips_count, post_context_clip_count = group
+        # all the groups share the retry budget of this run
+        with self.retry_policy.run_scope():
+            while len(unprocessed_groups) > 0:
+                logging.info(f'{len(unprocessed_groups)}/{total_unprocessed_groups} groups remaining')
+                # get group to be processed
+                group_index = next(iter(unprocessed_groups))
+                group = groups[group_index]
+                start_index, context_pre_clip_count, target_clips_count, post_context_clip_count = group
             
-            # get pre context clips
-            pre_context_clips = clips_data[start_index:start_index + context_pre_clip_count]
-            # get target clips
-            target_clips = clips_data[start_index + context_pre_clip_count:start_index + context_pre_clip_count + target_clips_count]
-            # get post context clips
-            post_context_clips = clips_data[start_index + context_pre_clip_count + target_clips_count:start_index + context_pre_clip_count + target_clips_count + post_context_clip_count]
+                # get pre context clips
+                pre_context_clips = clips_data[start_index:start_index + context_pre_clip_count]
+                # get target clips
+                target_clips = clips_data[start_index + context_pre_clip_count:start_index + context_pre_clip_count + target_clips_count]
+                # get post context clips
+                post_context_clips = clips_data[start_index + context_pre_clip_count + target_clips_count:start_index + context_pre_clip_count + target_clips_count + post_context_clip_count]
 
-            # correct the clips
-            corrected_transcriptions = None
-            for _ in range(self.max_retry_count):
+                # correct the clips; retries happen in the group corrector and the models, within the budget of this group
+                corrected_transcriptions = None
                 try:
-                    corrected_transcriptions = self.group_corrector.correct_transcriptions(
-                        clips_data=list(pre_context_clips) + list(target_clips) + list(post_context_clips),
-                        video_background=video_background,
-                        auxiliary_information=auxiliary_information,
-                        target_language=target_language
-                    )
-                    break
+                    corrected_transcriptions = self._correct_group(pre_context_clips, target_clips, post_context_clips,
+                                                                   video_background, auxiliary_information, target_language)
                 except Exception as e:
-                    continue
+                    error = e
             
-            if corrected_transcriptions is None:
-                # failure, skip these clips
-                # TODO: caching behavior? doing this would make these clips never be tried again!
-                transcriptions[group_index] = [''] * target_clips_count
+                if corrected_transcriptions is None:
+                    # failure, skip these clips
+                    # TODO: caching behavior? doing this would make these clips never be tried again!
+                    transcriptions[group_index] = [''] * target_clips_count
                 
-                logging.warning(f'Max retry count reached; group {group_index} skipped.')
-            else:
-                # success, add corrected transcriptions to transcriptions
-                transcriptions[group_index] = corrected_transcriptions[context_pre_clip_count:context_pre_clip_count + target_clips_count]
-                logging.info(f'Group {group_index} corrected successfully.')
+                    logging.warning(f'Correction failed ({self.retry_policy.classify(error)}: {error}); group {group_index} skipped.')
+                else:
+                    # success, add corrected transcriptions to transcriptions
+                    transcriptions[group_index] = corrected_transcriptions
+                    logging.info(f'Group {group_index} corrected successfully.')
             
-            assert len(transcriptions[group_index]) == target_clips_count
+                assert len(transcriptions[group_index]) == target_clips_count
 
-            # save the transcriptions to cache file
-            if cache_path is not None:
-                with open(cache_path, 'w') as f:
-                    json.dump(transcriptions, f, indent=4, ensure_ascii=False)
+                # save the transcriptions to cache file
+                if cache_path is not None:
+                    with open(cache_path, 'w') as f:
+                        json.dump(transcriptions, f, indent=4, ensure_ascii=False)
 
-            unprocessed_groups.remove(group_index)
+                unprocessed_groups.remove(group_index)
             
-            # call callback
-            group_completion_callback()
+                # call callback
+                group_completion_callback()
 
         # combine the trancriptions from each group
         combined_transcriptions = []
@@ -201,3 +209,33 @@ class ManyClipsBatchedCorrector(ManyClipsTranscriptionCorrector):
             combined_transcriptions += transcriptions[i]
         
         return combined_transcriptions
+
+    def _correct_group(self, pre_context_clips: Sequence[ClipData], target_clips: Sequence[ClipData], post_context_clips: Sequence[ClipData],
+                       video_background: str, auxiliary_information: str, target_language: str | None) -> List[str]:
+        """Corrects the target clips of a group, splitting them in halves if the output hits the length limit.
+
+        Returns:
+            List[str]: The corrected transcriptions of the target clips.
+        """
+
+        try:
+            with self.retry_policy.group_scope():
+                corrected_transcriptions = self.group_corrector.correct_transcriptions(
+                    clips_data=list(pre_context_clips) + list(target_clips) + list(post_context_clips),
+                    video_background=video_background,
+                    auxiliary_information=auxiliary_information,
+                    target_language=target_language
+                )
+        except Exception as e:
+            # retrying would hit the length limit again; only a smaller group can fit in it
+            if self.retry_policy.classify(e) != ErrorKinds.LENGTH_STOP or len(target_clips) <= 1:
+                raise
+
+            logging.warning(f'Correction output too long; correcting the {len(target_clips)} target clips in two halves.')
+
+            # the context clips also have to be transcribed, so each half keeps the context on its own side only
+            half = len(target_clips) // 2
+            return self._correct_group(pre_context_clips, target_clips[:half], [], video_background, auxiliary_information, target_language) + \
+                self._correct_group([], target_clips[half:], post_context_clips, video_background, auxiliary_information, target_language)
+
+        return list(corrected_transcriptions[len(pre_context_clips):len(pre_context_clips) + len(target_clips)])
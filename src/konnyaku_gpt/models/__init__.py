@@ -2,5 +2,7 @@ from .base import ModelService
 from .chat_completion import ChatCompletionService
 from .image_to_text import ImageToTextModelService
 from .transcriber import TranscriberModelService
+from .cached import CachedTranscriberModelService, CachedImageToTextModelService
+from .registry import ModelRegistry
 
 from . import gpt
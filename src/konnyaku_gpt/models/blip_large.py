@@ -1,26 +1,56 @@
 from .image_to_text import ImageToTextModelService
 from PIL import Image
+from typing import List
 from transformers import BlipProcessor, BlipForConditionalGeneration
 import torch
 
 import os
 
+from .cpu_inference import InferenceModes, configure_cpu_threads, quantize_linear_layers
 
-os.environ['TOKENIZERS_PARALLELISM'] = 'true'
 
 class BlipLarge(ImageToTextModelService):
 
-    def __init__(self):
-        self.device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
+    def __init__(self, inference_mode: str=InferenceModes.DEFAULT, num_threads: int | None=None):
+        """Constructor.
+
+        Args:
+            inference_mode (str, optional): How the model is run. One of the values in `InferenceModes`, except "onnx"
+                (exporting BLIP's generation loop to ONNX is not supported). Defaults to "default".
+            num_threads (int | None, optional): The number of CPU threads used for inference.
+                "None" means the default of torch. Defaults to None.
+        """
+        
+        # only set if the user has not configured it, instead of overriding it for the whole process on import
+        os.environ.setdefault('TOKENIZERS_PARALLELISM', 'true')
+        
         self.processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-large")
-        self.model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-large").to(self.device)
+        
+        configure_cpu_threads(num_threads)
+        
+        match inference_mode:
+            case InferenceModes.DEFAULT:
+                self.device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
+                self.model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-large").to(self.device)
+            case InferenceModes.CPU_QUANTIZED:
+                self.device = torch.device('cpu')
+                self.model = quantize_linear_layers(BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-large").eval())
+            case _:
+                raise Exception(f'Unsupported inference mode for BlipLarge: {inference_mode}')
 
     # override
     def call(self, image: Image) -> str:
+        return self.call_batch([image])[0]
+    
+    # override
+    def call_batch(self, images: List[Image.Image]) -> List[str]:
         text = ''
-        inputs = self.processor(image, text, return_tensors="pt").to(self.device)
-        out = self.model.generate(**inputs)
-        return self.processor.decode(out[0], skip_special_tokens=True)
+        inputs = self.processor(images, [text] * len(images), return_tensors="pt", padding=True).to(self.device)
+        
+        with torch.inference_mode():
+            out = self.model.generate(**inputs)
+        
+        return self.processor.batch_decode(out, skip_special_tokens=True)
     
     # override
     @staticmethod
@@ -0,0 +1,137 @@
+"""Model services which look up the outputs of other model services in a `ContentCache` before invoking them.
+
+Inputs are keyed by their decoded content (audio samples, image pixels),
+so the same content gets the cached output whichever video or clip it comes from.
+"""
+
+from pathlib import Path
+from typing import List, Tuple
+import json
+import numpy as np
+from PIL.Image import Image
+from .transcriber import TranscriberModelService
+from .image_to_text import ImageToTextModelService
+from ..cache import ContentCache
+
+
+def _audio_content(samples: np.ndarray, sampling_rate: int) -> bytes:
+    return str(sampling_rate).encode('utf-8') + np.ascontiguousarray(samples, dtype=np.float32).tobytes()
+
+
+class CachedTranscriberModelService(TranscriberModelService):
+    """Caches the outputs of a transcriber."""
+
+    def __init__(self, transcriber: TranscriberModelService, cache: ContentCache, namespace: str | None=None):
+        """Constructor.
+
+        Args:
+            transcriber (TranscriberModelService): The transcriber invoked on cache misses.
+            cache (ContentCache): The cache.
+            namespace (str | None, optional): Distinguishes the outputs of this transcriber from those of other models in the cache.
+                "None" means the class name of `transcriber`. Defaults to None.
+        """
+
+        self.transcriber = transcriber
+        self.cache = cache
+        self.namespace = namespace if namespace is not None else type(transcriber).__qualname__
+
+    def _get_or_compute(self, key: str, compute) -> str:
+        value = self.cache.get(key)
+
+        if value is None:
+            value = compute()
+            self.cache.put(key, value)
+
+        return value
+
+    # override
+    def call(self, audio_path: Path) -> str:
+        with open(audio_path, 'rb') as f:
+            key = ContentCache.make_key(self.namespace, 'file', f.read())
+
+        return self._get_or_compute(key, lambda: self.transcriber.call(audio_path))
+
+    # override
+    def call_array(self, samples: np.ndarray, sampling_rate: int) -> str:
+        key = ContentCache.make_key(self.namespace, 'samples', _audio_content(samples, sampling_rate))
+
+        return self._get_or_compute(key, lambda: self.transcriber.call_array(samples, sampling_rate))
+
+    # override
+    def call_batch(self, batch: List[np.ndarray], sampling_rate: int) -> List[str]:
+        keys = [ContentCache.make_key(self.namespace, 'samples', _audio_content(samples, sampling_rate)) for samples in batch]
+        texts = [self.cache.get(key) for key in keys]
+
+        # only the cache misses are sent to the transcriber
+        misses = [k for k, text in enumerate(texts) if text is None]
+        if len(misses) > 0:
+            miss_texts = self.transcriber.call_batch([batch[k] for k in misses], sampling_rate)
+
+            for k, text in zip(misses, miss_texts):
+                texts[k] = text
+                self.cache.put(keys[k], text)
+
+        return texts
+
+    # override
+    def call_with_timestamps(self, samples: np.ndarray, sampling_rate: int) -> List[Tuple[float, float, str]]:
+        key = ContentCache.make_key(self.namespace, 'segments', _audio_content(samples, sampling_rate))
+        value = self._get_or_compute(key, lambda: json.dumps(self.transcriber.call_with_timestamps(samples, sampling_rate), ensure_ascii=False))
+
+        return [tuple(segment) for segment in json.loads(value)]
+
+    # override
+    def get_description(self) -> str:
+        return self.transcriber.get_description()
+
+
+class CachedImageToTextModelService(ImageToTextModelService):
+    """Caches the outputs of an image captioner."""
+
+    def __init__(self, captioner: ImageToTextModelService, cache: ContentCache, namespace: str | None=None):
+        """Constructor.
+
+        Args:
+            captioner (ImageToTextModelService): The captioner invoked on cache misses.
+            cache (ContentCache): The cache.
+            namespace (str | None, optional): Distinguishes the outputs of this captioner from those of other models in the cache.
+                "None" means the class name of `captioner`. Defaults to None.
+        """
+
+        self.captioner = captioner
+        self.cache = cache
+        self.namespace = namespace if namespace is not None else type(captioner).__qualname__
+
+    def _make_key(self, image: Image) -> str:
+        return ContentCache.make_key(self.namespace, image.mode, f'{image.width}x{image.height}', image.tobytes())
+
+    # override
+    def call(self, image: Image) -> str:
+        key = self._make_key(image)
+        caption = self.cache.get(key)
+
+        if caption is None:
+            caption = self.captioner.call(image)
+            self.cache.put(key, caption)
+
+        return caption
+
+    # override
+    def call_batch(self, images: List[Image]) -> List[str]:
+        keys = [self._make_key(image) for image in images]
+        captions = [self.cache.get(key) for key in keys]
+
+        # only the cache misses are sent to the captioner
+        misses = [k for k, caption in enumerate(captions) if caption is None]
+        if len(misses) > 0:
+            miss_captions = self.captioner.call_batch([images[k] for k in misses])
+
+            for k, caption in zip(misses, miss_captions):
+                captions[k] = caption
+                self.cache.put(keys[k], caption)
+
+        return captions
+
+    # override
+    def get_description(self) -> str:
+        return self.captioner.get_description()
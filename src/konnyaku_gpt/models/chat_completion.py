@@ -1,6 +1,7 @@
 from .base import ModelService
 from abc import ABC, abstractmethod
 from typing import Sequence, Tuple
+import asyncio
 
 
 class ChatCompletionService(ModelService):
@@ -21,3 +22,18 @@ class ChatCompletionService(ModelService):
         """
         
         raise NotImplementedError()
+
+    async def acall(self, messages: Sequence[Tuple[str, bool]]) -> str:
+        """Like `call`, but awaitable, so that many calls can be in flight on one event loop.
+
+        The default implementation runs `call` in a worker thread.
+        Subclasses backed by an asynchronous client should override it.
+
+        Args:
+            messages (Sequence[Tuple[str, bool]]): The chat message history. See `call`.
+
+        Returns:
+            str: The next bot-sent message.
+        """
+
+        return await asyncio.to_thread(self.call, messages)
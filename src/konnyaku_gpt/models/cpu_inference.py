@@ -0,0 +1,47 @@
+"""Helpers for running local models efficiently on CPU."""
+
+import torch
+
+
+class InferenceModes:
+    """How a local model is run."""
+
+    # the original fp32 model, on GPU if available
+    DEFAULT = 'default'
+    # the fp32 model on CPU with the weights of its linear layers dynamically quantized to int8
+    CPU_QUANTIZED = 'cpu-quantized'
+    # an exported ONNX graph run with onnxruntime on CPU (requires the "onnx" extra, i.e., optimum[onnxruntime])
+    ONNX = 'onnx'
+
+
+def configure_cpu_threads(num_threads: int | None) -> None:
+    """Sets the number of threads that torch uses for intra-op parallelism.
+
+    Args:
+        num_threads (int | None): The number of threads, typically the number of physical cores.
+            "None" means keeping torch's default.
+    """
+
+    if num_threads is not None:
+        assert num_threads >= 1, f'num_threads must be positive, but got {num_threads}!'
+        torch.set_num_threads(num_threads)
+
+
+def quantize_linear_layers(model: torch.nn.Module) -> torch.nn.Module:
+    """Dynamically quantizes the linear layers of a (CPU) model to int8.
+
+    Activations are quantized on the fly, so no calibration is needed.
+    """
+
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def import_optimum_onnxruntime():
+    """Imports `optimum.onnxruntime`, which is an optional dependency."""
+
+    try:
+        import optimum.onnxruntime
+    except ImportError as e:
+        raise Exception(f'ONNX inference requires optimum with onnxruntime (pip install "konnyaku_gpt[onnx]"): {e}')
+
+    return optimum.onnxruntime
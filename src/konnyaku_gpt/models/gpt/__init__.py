@@ -1,3 +1,4 @@
 from .openai_gpt_server import OpenAiGptServer
 from .gpt_35_turbo import GPT35Turbo
 from .gpt4 import GPT4
+from .rate_limiter import TokenBucketRateLimiter, RequestTooLargeError
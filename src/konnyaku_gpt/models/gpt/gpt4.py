@@ -2,35 +2,47 @@ from typing import Sequence, Tuple, Dict
 
 from ..chat_completion import ChatCompletionService
 from .openai_gpt_server import OpenAiGptServer
+from ...retry_policy import RetryPolicy, ErrorKinds, policy_from_deprecated_count
 
 
 class GPT4(ChatCompletionService):
 
-    def __init__(self, openai_gpt_server: OpenAiGptServer, context_length: str='8k', max_retry_count: int=3) -> None:
+    def __init__(self, openai_gpt_server: OpenAiGptServer, context_length: str='8k', retry_policy: RetryPolicy | None=None,
+                 max_retry_count: int | None=None) -> None:
         """Constructor.
 
         Args:
-            max_retry_count (int): The maximum number to retry on each call.
+            retry_policy (RetryPolicy | None): Retries each call on rate limits, timeouts and API errors.
+                Share one policy across all layers so that they draw from the same retry budgets. "None" means a default policy.
+            max_retry_count (int | None): Deprecated; the maximum number of attempts of each call.
+                Equivalent to `retry_policy=RetryPolicy(max_attempts=max_retry_count)`.
             context_length (str): The maximum context length. Either "8k" or "32k".
         """
         
         super().__init__()
 
         self._openai_server = openai_gpt_server
-        self._max_retry_count = max_retry_count
+        assert retry_policy is None or max_retry_count is None, 'Pass either retry_policy or the deprecated max_retry_count, not both!'
+
+        if max_retry_count is not None:
+            retry_policy = policy_from_deprecated_count('max_retry_count', max_attempts=max_retry_count, accountant=openai_gpt_server.accountant)
+
+        self._retry_policy = retry_policy if retry_policy is not None else RetryPolicy(accountant=openai_gpt_server.accountant)
         self._context_length = context_length
     
+    @property
+    def _model_name(self) -> str:
+        return 'gpt-4' + ('-32k' if self._context_length == '32k' else '')
+
     # override
     def call(self, messages: Sequence[Tuple[str, bool]]) -> str:
-        for _ in range(self._max_retry_count):
-            try:
-                result = self._openai_server.invoke('gpt-4' + ('-32k' if self._context_length == '32k' else ''), messages)
-                return result
-                
-            except Exception:
-                continue
-        
-        raise Exception(f'Max retry count of ({self._max_retry_count}) reached!')
+        return self._retry_policy.call(lambda: self._openai_server.invoke(self._model_name, messages), retry_on=ErrorKinds.TRANSIENT,
+                                       model_name=self._model_name)
+
+    # override
+    async def acall(self, messages: Sequence[Tuple[str, bool]]) -> str:
+        return await self._retry_policy.acall(lambda: self._openai_server.ainvoke(self._model_name, messages), retry_on=ErrorKinds.TRANSIENT,
+                                              model_name=self._model_name)
         
     # override
     @staticmethod
@@ -1,8 +1,18 @@
-from openai import OpenAI
+from openai import AsyncOpenAI, RateLimitError
 from openai.types.chat import ChatCompletion
 
-from typing import Sequence, Tuple, Dict
+from typing import Sequence, Tuple, Dict, List
+import asyncio
+import json
 import logging
+import threading
+import time
+import httpx
+
+from .rate_limiter import TokenBucketRateLimiter, estimate_prompt_tokens
+from ...cache import ContentCache
+from ...retry_policy import GenerationStoppedError, refreshing_responses
+from ...accounting import UsageAccountant, ANY_MODEL
 
 
 class OpenAiGptServer:
@@ -14,32 +24,190 @@ class OpenAiGptServer:
         'gpt-4': (0.03, 0.06),
         'gpt-4-32k': (0.06, 0.12),
     }
+
+    # {model name: (requests per minute, tokens per minute)}; the usage tier 1 limits of OpenAI, e.g., for `rate_limits`
+    tier_1_rate_limits = {
+        'gpt-3.5-turbo': (3500, 60000),
+        'gpt-3.5-turbo-16k': (3500, 60000),
+        'gpt-4': (500, 10000),
+        'gpt-4-32k': (500, 10000),
+    }
     
-    def __init__(self):
-        # {model name: input tokens used, output tokens used}
-        self.token_usages = {name: (0, 0) for name in self.price_info.keys()}
-        self.client = OpenAI()
+    def __init__(self, rate_limits: Dict[str, Tuple[float, float]] | None=None, response_cache: ContentCache | None=None):
+        """Constructor.
+
+        Args:
+            rate_limits (Dict[str, Tuple[float, float]] | None, optional): The rate limits of the account,
+                as {model name: (requests per minute, tokens per minute)}, e.g., `OpenAiGptServer.tier_1_rate_limits`.
+                Requests to each model listed are throttled client-side to stay within its limits,
+                and a request exceeding the tokens per minute raises `RequestTooLargeError` instead of being sent.
+                "None" means no client-side limiting (rate-limited requests are still retried by `RetryPolicy`). Defaults to None.
+            response_cache (ContentCache | None, optional): A cache of responses keyed by the model name and the messages,
+                so that a re-run replays the responses without paying for them again.
+                Only responses that arrive are cached; failed requests (e.g., rate-limited) leave no entries.
+                Requests retried after an unusable output (see `refreshing_responses`) are sent again and overwrite their entries,
+                so that a re-run replays the output that was finally used. "None" means no caching. Defaults to None.
+        """
+
+        # tokens, cost, latency and retries per model and per stage
+        self.accountant = UsageAccountant()
+        self.rate_limiters = {
+            name: TokenBucketRateLimiter(requests_per_minute, tokens_per_minute)
+            for name, (requests_per_minute, tokens_per_minute) in (rate_limits or {}).items()
+        }
+        self.response_cache = response_cache
+        # the SDK does not retry by itself, so that `RetryPolicy` is the only retry layer
+        # and the rate limiters see every rate-limit response
+        self.async_client = AsyncOpenAI(max_retries=0)
+        # `invoke` runs `ainvoke` on an event loop of its own, which is started on first use;
+        # it has its own client, since a client must stay on one event loop
+        self._invoke_client = AsyncOpenAI(max_retries=0)
+        self._invoke_loop: asyncio.AbstractEventLoop | None = None
+        self._invoke_loop_lock = threading.Lock()
     
     
     def invoke(self, model_name: str, messages: Sequence[Tuple[str, bool]]) -> str:
+        """Invokes a model with a chat history, blocking until the response arrives.
+
+        Runs `ainvoke` on an event loop in a background thread, which is shared by all the threads calling `invoke`.
+
+        Args:
+            model_name (str): The model name, e.g., "gpt-4".
+            messages (Sequence[Tuple[str, bool]]): The chat message history. See `ChatCompletionService.call`.
+
+        Returns:
+            str: The next bot-sent message.
+        """
+
+        # the coroutine runs in a copy of the caller's context, e.g., its LLM stage and retry budgets
+        return asyncio.run_coroutine_threadsafe(self.ainvoke(model_name, messages), self._get_invoke_loop()).result()
+
+    async def ainvoke(self, model_name: str, messages: Sequence[Tuple[str, bool]]) -> str:
+        """Invokes a model with a chat history without blocking the event loop.
+
+        Many invocations can be awaited concurrently on one event loop, e.g., with `asyncio.gather`.
+
+        Args:
+            model_name (str): The model name, e.g., "gpt-4".
+            messages (Sequence[Tuple[str, bool]]): The chat message history. See `ChatCompletionService.call`.
+
+        Returns:
+            str: The next bot-sent message.
+        """
+
+        openai_messages, cache_key, cached_result = self._before_request(model_name, messages)
+        if cached_result is not None:
+            return cached_result
+
+        rate_limiter = self.rate_limiters.get(model_name)
+        estimated_tokens = estimate_prompt_tokens(messages)
+        wait_start = time.perf_counter()
+        if rate_limiter is not None:
+            await rate_limiter.aacquire(estimated_tokens)
+
+        request_start = time.perf_counter()
+        try:
+            client = self._invoke_client if asyncio.get_running_loop() is self._invoke_loop else self.async_client
+            response = await client.chat.completions.create(
+                model=model_name,
+                messages=openai_messages
+            )
+        except Exception as e:
+            self._handle_request_error(model_name, e, time.perf_counter() - request_start, request_start - wait_start)
+            raise
+
+        return self._after_response(model_name, messages, response, cache_key, estimated_tokens,
+                                    time.perf_counter() - request_start, request_start - wait_start)
+
+    def _get_invoke_loop(self) -> asyncio.AbstractEventLoop:
+        with self._invoke_loop_lock:
+            if self._invoke_loop is None:
+                self._invoke_loop = asyncio.new_event_loop()
+                threading.Thread(target=self._invoke_loop.run_forever, name='openai-invoke-loop', daemon=True).start()
+
+            return self._invoke_loop
+
+    def _before_request(self, model_name: str, messages: Sequence[Tuple[str, bool]]) -> Tuple[List[Dict[str, str]], str | None, str | None]:
+        """Builds a request and looks it up in the response cache.
+
+        Returns:
+            Tuple[List[Dict[str, str]], str | None, str | None]: The OpenAI messages, the cache key (if caching),
+                and the cached response (if any), which should be returned without sending the request.
+        """
+
+        openai_messages = self._build_request(model_name, messages)
+
+        cache_key = self._make_response_cache_key(model_name, openai_messages)
+        if cache_key is not None and not refreshing_responses():
+            result = self.response_cache.get(cache_key)
+            if result is not None:
+                logging.info(f'Response from {model_name} found in cache; skipping invocation')
+                self.accountant.record_cache_hit(model_name)
+                return openai_messages, cache_key, result
+
+        return openai_messages, cache_key, None
+
+    def _after_response(self, model_name: str, messages: Sequence[Tuple[str, bool]], response: ChatCompletion, cache_key: str | None,
+                        estimated_tokens: int, latency: float, rate_limit_wait: float) -> str:
+        """Records the usage of a response to the rate limiter and the accountant, and caches and returns its message."""
+
+        rate_limiter = self.rate_limiters.get(model_name)
+        if rate_limiter is not None:
+            rate_limiter.record_success(estimated_tokens, response.usage.total_tokens)
+
+        result = self._handle_response(model_name, messages, response, latency, rate_limit_wait)
+        if cache_key is not None:
+            self.response_cache.put(cache_key, result)
+
+        return result
+
+    def _build_request(self, model_name: str, messages: Sequence[Tuple[str, bool]]) -> List[Dict[str, str]]:
         messages = [
             {"role": "user" if is_user else "assistant", "content": message}
             for message, is_user in messages
         ]
         
         logging.info(f'Invoking {model_name} with the following messages:\n\n{messages}')
-        
-        response = self.client.chat.completions.create(
-            model=model_name,
-            messages=messages
-        )
 
-        self._update_records(model_name, response)
-        
+        return messages
+
+    def _make_response_cache_key(self, model_name: str, openai_messages: List[Dict[str, str]]) -> str | None:
+        if self.response_cache is None:
+            return None
+
+        return ContentCache.make_key('chat-completion', model_name, json.dumps(openai_messages, ensure_ascii=False))
+
+    def _handle_request_error(self, model_name: str, error: Exception, latency: float, rate_limit_wait: float) -> None:
+        self.accountant.record_failed_request(model_name, latency, rate_limit_wait)
+
+        rate_limiter = self.rate_limiters.get(model_name)
+        if isinstance(error, RateLimitError) and rate_limiter is not None:
+            rate_limiter.record_rate_limited(self._parse_retry_after(error.response))
+
+    @staticmethod
+    def _parse_retry_after(response: httpx.Response) -> float | None:
+        """Parses the "Retry-After" duration (in seconds) of a response, if any."""
+
+        for header, scale in (('retry-after-ms', 0.001), ('retry-after', 1.0)):
+            value = response.headers.get(header)
+            if value is None:
+                continue
+
+            try:
+                return float(value) * scale
+            except ValueError:
+                # e.g., an HTTP date, which is not used by the API
+                continue
+
+        return None
+
+    def _handle_response(self, model_name: str, messages: Sequence[Tuple[str, bool]], response: ChatCompletion,
+                         latency: float, rate_limit_wait: float) -> str:
         money_spent = self.calc_money_spent(model_name, response)
-        total_money_spent = self.money_spent['total']
+        self.accountant.record_request(model_name, response.usage.prompt_tokens, response.usage.completion_tokens, money_spent,
+                                       latency, rate_limit_wait)
 
-        logging.info(f'{model_name} costs ${money_spent: .2e} on this invocation; cumulative total cost from all models: ${total_money_spent: .2e}')
+        logging.info(f'{model_name} costs ${money_spent: .2e} on this invocation; cumulative total cost from all models: ${self.accountant.total_cost: .2e}')
         
         stop_reason = response.choices[0].finish_reason
         if stop_reason != 'stop':
@@ -48,28 +216,41 @@ class OpenAiGptServer:
             
             logging.warning(error_message)
             
-            raise Exception(error_message)
+            raise GenerationStoppedError(error_message, stop_reason)
         else:
             result = response.choices[0].message.content
             logging.debug(f'Response from {model_name}:\n<response-start>\n{result}\n<response-end>')
 
             return result
     
+    @property
+    def token_usages(self) -> Dict[str, Tuple[int, int]]:
+        """
+        {model name: (input tokens used, output tokens used)}
+        """
+
+        token_usages = {name: (0, 0) for name in self.price_info.keys()}
+
+        for model_name, record in self.accountant.totals_by_model().items():
+            # retries of layers above models, which use no tokens
+            if model_name != ANY_MODEL:
+                token_usages[model_name] = (record.input_tokens, record.output_tokens)
+
+        return token_usages
+
     @property
     def money_spent(self) -> Dict[str, float]:
         """
         the money spent, in dollars.
         """
         
-        money_spent_by_model = {}
+        money_spent_by_model = {name: 0.0 for name in self.price_info.keys()}
 
-        for model_name in self.price_info.keys():
-            input_price, output_price = self.price_info[model_name]
-            input_tokens, output_tokens = self.token_usages[model_name]
-            
-            money_spent_by_model[model_name] = input_price * input_tokens / 1000 + output_price * output_tokens / 1000
+        for model_name, record in self.accountant.totals_by_model().items():
+            if model_name != ANY_MODEL:
+                money_spent_by_model[model_name] = record.cost
 
-        money_spent_by_model['total'] = sum(money_spent_by_model.values())
+        money_spent_by_model['total'] = self.accountant.total_cost
 
         return money_spent_by_model
     
@@ -81,13 +262,3 @@ class OpenAiGptServer:
         )
         
         return self.price_info[model_name][0] * prompt_tokens / 1000 + self.price_info[model_name][1] * completion_tokens / 1000
-            
-    def _update_records(self, model_name: str, response: ChatCompletion) -> None:
-        token_usage = response.usage
-        completion_tokens, prompt_tokens = (
-            token_usage.completion_tokens,
-            token_usage.prompt_tokens
-        )
-        
-        current_total_input_tokens, current_total_output_tokens = self.token_usages[model_name]
-        self.token_usages[model_name] = (current_total_input_tokens + prompt_tokens, current_total_output_tokens + completion_tokens)
\ No newline at end of file
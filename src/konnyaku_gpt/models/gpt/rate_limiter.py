@@ -0,0 +1,141 @@
+"""Client-side rate limiting of requests to a model, by requests per minute and tokens per minute."""
+
+from typing import Sequence, Tuple
+import asyncio
+import logging
+import threading
+import time
+
+
+def estimate_prompt_tokens(messages: Sequence[Tuple[str, bool]]) -> int:
+    """Estimates the number of prompt tokens of a chat history without a tokenizer.
+
+    ASCII text averages about 4 characters per token; other characters (e.g., Japanese) are counted as one token each,
+    which slightly overestimates, so that the rate limits are rarely exceeded.
+    """
+
+    n_tokens = 3
+    for message, _ in messages:
+        n_ascii = sum(1 for c in message if c.isascii())
+        n_tokens += 4 + (n_ascii + 3) // 4 + (len(message) - n_ascii)
+
+    return n_tokens
+
+
+class RequestTooLargeError(Exception):
+    """Raised for a request whose (estimated) tokens exceed the tokens per minute, which could never be sent within the limits."""
+
+
+class TokenBucketRateLimiter:
+    """Limits the requests and the tokens sent to a model per minute with two token buckets.
+
+    Each bucket refills at its per-minute limit and holds at most one minute worth of capacity.
+    Capacity is reserved with an estimate of the tokens before sending a request,
+    and the estimate is corrected with the actual usage afterwards.
+
+    On rate-limit (429) responses, all requests are paused for the "Retry-After" duration (exponential backoff if absent),
+    and the rates are halved; each successful request then restores 5% of the configured rates.
+    """
+
+    # the rates are never tightened beyond this fraction of the configured ones
+    MIN_RATE_SCALE = 0.1
+    RATE_DECREASE_FACTOR = 0.5
+    RATE_RECOVERY_STEP = 0.05
+    MAX_BACKOFF = 60.0
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        """Constructor.
+
+        Args:
+            requests_per_minute (float): The maximum number of requests per minute.
+            tokens_per_minute (float): The maximum number of tokens (prompt + completion) per minute.
+        """
+
+        assert requests_per_minute > 0, f'requests_per_minute must be positive, but got {requests_per_minute}!'
+        assert tokens_per_minute > 0, f'tokens_per_minute must be positive, but got {tokens_per_minute}!'
+
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+
+        self._lock = threading.Lock()
+        self._rate_scale = 1.0
+        # the capacity available in each bucket; negative when reserved ahead of time
+        self._available_requests = float(requests_per_minute)
+        self._available_tokens = float(tokens_per_minute)
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._consecutive_rate_limits = 0
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._last_refill
+        self._last_refill = now
+
+        self._available_requests = min(self.requests_per_minute,
+                                       self._available_requests + elapsed * self.requests_per_minute * self._rate_scale / 60)
+        self._available_tokens = min(self.tokens_per_minute,
+                                     self._available_tokens + elapsed * self.tokens_per_minute * self._rate_scale / 60)
+
+    def _reserve(self, tokens: int) -> float:
+        """Reserves capacity for a request, and returns how long (in seconds) to wait before sending it."""
+
+        # the bucket never holds more than one minute worth of tokens
+        if tokens > self.tokens_per_minute:
+            raise RequestTooLargeError(f'A request of ~{tokens} tokens exceeds the limit of {self.tokens_per_minute} tokens per minute; split it into smaller requests!')
+
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+
+            self._available_requests -= 1
+            self._available_tokens -= tokens
+
+            wait = max(
+                self._paused_until - now,
+                -self._available_requests * 60 / (self.requests_per_minute * self._rate_scale),
+                -self._available_tokens * 60 / (self.tokens_per_minute * self._rate_scale),
+                0.0
+            )
+
+        if wait > 0:
+            logging.debug(f'Rate limiter: waiting {wait:.2f}s before sending a request of ~{tokens} tokens')
+
+        return wait
+
+    def acquire(self, tokens: int) -> None:
+        """Blocks until a request with an estimated number of tokens can be sent.
+
+        Raises `RequestTooLargeError` if the request exceeds the tokens per minute.
+        """
+
+        time.sleep(self._reserve(tokens))
+
+    async def aacquire(self, tokens: int) -> None:
+        """Waits (without blocking the event loop) until a request with an estimated number of tokens can be sent."""
+
+        await asyncio.sleep(self._reserve(tokens))
+
+    def record_success(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """Corrects the reserved tokens with the actual usage of a request, and relaxes the rates after backoff."""
+
+        with self._lock:
+            self._available_tokens -= actual_tokens - estimated_tokens
+            self._rate_scale = min(1.0, self._rate_scale + self.RATE_RECOVERY_STEP)
+            self._consecutive_rate_limits = 0
+
+    def record_rate_limited(self, retry_after: float | None) -> None:
+        """Tightens the rates after a rate-limit (429) response.
+
+        Args:
+            retry_after (float | None): The "Retry-After" duration (in seconds) of the response, if any.
+        """
+
+        with self._lock:
+            self._consecutive_rate_limits += 1
+            self._rate_scale = max(self.MIN_RATE_SCALE, self._rate_scale * self.RATE_DECREASE_FACTOR)
+
+            if retry_after is None:
+                retry_after = min(self.MAX_BACKOFF, 2.0 ** (self._consecutive_rate_limits - 1))
+
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+        logging.warning(f'Rate limited; pausing requests for {retry_after:.2f}s and reducing the rates to {self._rate_scale:.0%} of the limits')
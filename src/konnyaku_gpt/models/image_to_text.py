@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from typing import List
 from .base import ModelService
 from PIL.Image import Image
 
@@ -19,3 +20,18 @@ class ImageToTextModelService(ModelService):
         """
         
         raise NotImplementedError()
+    
+    def call_batch(self, images: List[Image]) -> List[str]:
+        """Generates descriptions of several images at once.
+        
+        The default implementation calls `call` on each image;
+        local models should override it to run inference on the whole batch.
+
+        Args:
+            images (List[Image]): The images.
+
+        Returns:
+            List[str]: The descriptions, in the same order as `images`.
+        """
+        
+        return [self.call(image) for image in images]
@@ -0,0 +1,93 @@
+"""A registry that manages the lifecycle of model services."""
+
+from typing import Callable, Dict
+import gc
+import sys
+import logging
+import threading
+from .base import ModelService
+
+
+class ModelRegistry:
+    """Constructs each registered model service lazily and at most once until it is unloaded.
+
+    Descriptions are read from the class of a model service when it is registered by its class
+    (`ModelService.get_description` is static), so reading them never loads a model.
+    """
+
+    def __init__(self):
+        self._instantiators: Dict[str, Callable[[], ModelService]] = {}
+        self._instances: Dict[str, ModelService] = {}
+        self._descriptions: Dict[str, str] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+
+    def register(self, name: str, instantiator: Callable[[], ModelService]) -> None:
+        """Registers a model service.
+
+        Args:
+            name (str): The name of the model service in this registry.
+            instantiator (Callable[[], ModelService]): Constructs the model service.
+                Pass the class itself (e.g., `BlipLarge`) rather than a lambda so that its description can be read without constructing it.
+        """
+
+        assert name not in self._instantiators, f'A model service named {name} is already registered!'
+
+        self._instantiators[name] = instantiator
+        self._locks[name] = threading.Lock()
+
+    def get(self, name: str) -> ModelService:
+        """Gets a model service, constructing it if it is not loaded."""
+
+        # one lock per model service, so that different models can be loaded concurrently
+        with self._locks[name]:
+            if name not in self._instances:
+                logging.info(f'Loading model service: {name}')
+                self._instances[name] = self._instantiators[name]()
+
+            return self._instances[name]
+
+    def instantiator(self, name: str) -> Callable[[], ModelService]:
+        """Returns an instantiator that gets the (shared) model service from this registry."""
+
+        return lambda: self.get(name)
+
+    def get_description(self, name: str) -> str:
+        """Gets the description of a model service, constructing it only if neither its class nor a loaded instance is available."""
+
+        if name not in self._descriptions:
+            instantiator = self._instantiators[name]
+
+            if isinstance(instantiator, type) and issubclass(instantiator, ModelService):
+                self._descriptions[name] = instantiator.get_description()
+            else:
+                self._descriptions[name] = self.get(name).get_description()
+
+        return self._descriptions[name]
+
+    def unload(self, name: str) -> None:
+        """Releases a model service (if loaded), so that its memory can be freed. It is constructed again when needed."""
+
+        with self._locks[name]:
+            instance = self._instances.pop(name, None)
+
+            if instance is None:
+                return
+
+            # keep the description, which may need the instance
+            if name not in self._descriptions:
+                self._descriptions[name] = instance.get_description()
+
+            logging.info(f'Unloading model service: {name}')
+            del instance
+
+        gc.collect()
+
+        # return cached GPU memory if torch has been used
+        if 'torch' in sys.modules:
+            torch = sys.modules['torch']
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+    def unload_all(self) -> None:
+        for name in self._instantiators:
+            self.unload(name)
@@ -4,7 +4,12 @@ Backend: whisper-small (local, cuda if available else cpu)
 """
 from abc import ABC, abstractmethod
 from pathlib import Path
+from typing import List, Tuple
+import os
+import tempfile
+import numpy as np
 from .base import ModelService
+from ..audio import write_wav
 
 
 
@@ -24,3 +29,60 @@ class TranscriberModelService(ModelService):
         """
         
         raise NotImplementedError()
+    
+    def call_array(self, samples: np.ndarray, sampling_rate: int) -> str:
+        """Generates a transcription of mono audio samples.
+        
+        The default implementation writes the samples into a temporary wav file and calls `call`;
+        models which work on samples should override it to avoid the round trip.
+        
+        Args:
+            samples (np.ndarray): The float samples, in [-1, 1]. May be a read-only view of a memory-mapped file.
+            sampling_rate (int): The sampling rate of the samples.
+        
+        Returns:
+            str: The transcription.
+        """
+        
+        fd, tmp_path = tempfile.mkstemp(suffix='.wav')
+        os.close(fd)
+        
+        try:
+            write_wav(Path(tmp_path), samples, sampling_rate)
+            return self.call(Path(tmp_path))
+        finally:
+            os.remove(tmp_path)
+    
+    def call_batch(self, batch: List[np.ndarray], sampling_rate: int) -> List[str]:
+        """Generates transcriptions of several pieces of mono audio at once.
+        
+        The default implementation calls `call_array` on each of them;
+        local models should override it to run inference on the whole batch.
+        
+        Args:
+            batch (List[np.ndarray]): The float samples of each piece of audio, in [-1, 1].
+            sampling_rate (int): The sampling rate of the samples.
+        
+        Returns:
+            List[str]: The transcriptions, in the same order as `batch`.
+        """
+        
+        return [self.call_array(samples, sampling_rate) for samples in batch]
+    
+    def call_with_timestamps(self, samples: np.ndarray, sampling_rate: int) -> List[Tuple[float, float, str]]:
+        """Generates a transcription of mono audio samples, split into timestamped segments.
+        
+        The default implementation returns the whole transcription as a single segment;
+        models which can predict timestamps should override it.
+        
+        Args:
+            samples (np.ndarray): The float samples, in [-1, 1].
+            sampling_rate (int): The sampling rate of the samples.
+        
+        Returns:
+            List[Tuple[float, float, str]]: The segments as (start, end, text), with start & end in seconds from the start of the audio.
+        """
+        
+        text = self.call_array(samples, sampling_rate)
+        
+        return [(0.0, len(samples) / sampling_rate, text)] if text else []
@@ -1,35 +1,95 @@
 from .transcriber import TranscriberModelService
 from pathlib import Path
+from typing import List, Tuple
 
 import torch
 from transformers import WhisperProcessor, WhisperForConditionalGeneration
 import librosa
+import numpy as np
+
+from .cpu_inference import InferenceModes, configure_cpu_threads, quantize_linear_layers, import_optimum_onnxruntime
 
 
 class Whisper(TranscriberModelService):
     
-    def __init__(self):
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    def __init__(self, inference_mode: str=InferenceModes.DEFAULT, num_threads: int | None=None):
+        """Constructor.
+
+        Args:
+            inference_mode (str, optional): How the model is run. One of the values in `InferenceModes`.
+                The modes other than "default" run on CPU. Defaults to "default".
+            num_threads (int | None, optional): The number of CPU threads used for inference.
+                "None" means the default of torch / onnxruntime. Defaults to None.
+        """
         
         # load model and processor
         self.processor = WhisperProcessor.from_pretrained("openai/whisper-small")
-        self.model = WhisperForConditionalGeneration.from_pretrained("openai/whisper-small").to(self.device)
         self.forced_decoder_ids = self.processor.get_decoder_prompt_ids(language="japanese", task="transcribe")
+        
+        configure_cpu_threads(num_threads)
+        
+        match inference_mode:
+            case InferenceModes.DEFAULT:
+                self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+                self.model = WhisperForConditionalGeneration.from_pretrained("openai/whisper-small").to(self.device)
+            case InferenceModes.CPU_QUANTIZED:
+                self.device = torch.device("cpu")
+                self.model = quantize_linear_layers(WhisperForConditionalGeneration.from_pretrained("openai/whisper-small").eval())
+            case InferenceModes.ONNX:
+                optimum_onnxruntime = import_optimum_onnxruntime()
+                import onnxruntime
+                
+                session_options = onnxruntime.SessionOptions()
+                if num_threads is not None:
+                    session_options.intra_op_num_threads = num_threads
+                
+                self.device = torch.device("cpu")
+                self.model = optimum_onnxruntime.ORTModelForSpeechSeq2Seq.from_pretrained("openai/whisper-small", export=True,
+                                                                                         session_options=session_options)
+            case _:
+                raise Exception(f'Unknown inference mode: {inference_mode}')
+    
+    def _generate(self, input_features: torch.Tensor) -> torch.Tensor:
+        with torch.inference_mode():
+            return self.model.generate(input_features.to(self.device), forced_decoder_ids=self.forced_decoder_ids, return_timestamps=True)
     
     # override
     def call(self, audio_path: Path):
         array, sampling_rate = librosa.load(audio_path, sr=16000)
-        sample = {"path": audio_path, "array": array, "sampling_rate": sampling_rate}
-
-        input_speech = sample
-        input_features = self.processor(input_speech["array"], sampling_rate=input_speech["sampling_rate"], return_tensors="pt").input_features.to(self.device)
+        
+        return self.call_array(array, sampling_rate)
+    
+    # override
+    def call_array(self, samples: np.ndarray, sampling_rate: int) -> str:
+        return self.call_batch([samples], sampling_rate)[0]
+    
+    # override
+    def call_batch(self, batch: List[np.ndarray], sampling_rate: int) -> List[str]:
+        if sampling_rate != 16000:
+            batch = [librosa.resample(np.asarray(samples, dtype=np.float32), orig_sr=sampling_rate, target_sr=16000) for samples in batch]
+            sampling_rate = 16000
+        
+        # the feature extractor pads (or truncates) every input to 30 seconds
+        input_features = self.processor(batch, sampling_rate=sampling_rate, return_tensors="pt").input_features
 
         # generate token ids
-        predicted_ids = self.model.generate(input_features, forced_decoder_ids=self.forced_decoder_ids, return_timestamps=True)
-        # decode token ids to text
-        transcription = self.processor.batch_decode(predicted_ids, skip_special_tokens=True, return_timestampes=True)
+        predicted_ids = self._generate(input_features)
+        # decode token ids to text (one sequence per input)
+        return self.processor.batch_decode(predicted_ids, skip_special_tokens=True, return_timestampes=True)
+    
+    # override
+    def call_with_timestamps(self, samples: np.ndarray, sampling_rate: int) -> List[Tuple[float, float, str]]:
+        if sampling_rate != 16000:
+            samples = librosa.resample(np.asarray(samples, dtype=np.float32), orig_sr=sampling_rate, target_sr=16000)
+            sampling_rate = 16000
+        
+        input_features = self.processor(samples, sampling_rate=sampling_rate, return_tensors="pt").input_features
+
+        predicted_ids = self._generate(input_features)
+        # the offsets are the segments delimited by the predicted timestamp tokens
+        decoded = self.processor.tokenizer.decode(predicted_ids[0], skip_special_tokens=True, output_offsets=True)
         
-        return '\n'.join(transcription)
+        return [(float(offset['timestamp'][0]), float(offset['timestamp'][1]), offset['text']) for offset in decoded['offsets']]
     
     @staticmethod
     def get_description() -> str:
@@ -1,27 +1,59 @@
 from pathlib import Path
+from typing import List, Tuple
 from .transcriber import TranscriberModelService
+from ..audio import ASR_SAMPLING_RATE, decode_audio, encode_compact_audio
 from openai import OpenAI
-from moviepy.audio.io.AudioFileClip import AudioFileClip
 import logging
+import numpy as np
+
+# audio shorter than this (in seconds) is not sent to the API
+MIN_AUDIO_DURATION = 0.2
 
 
 class WhisperCloud(TranscriberModelService):
+    """Transcribes audio with the OpenAI API.
+    
+    Audio is uploaded as compact 16 kHz mono Opus encoded in memory, instead of the files it is given.
+    """
     
     def __init__(self) -> None:
         self.client = OpenAI()
         
     def call(self, audio_path: Path) -> str:
-        if AudioFileClip(audio_path).duration < 0.2:
+        return self.call_array(decode_audio(audio_path), ASR_SAMPLING_RATE)
+    
+    # override
+    def call_array(self, samples: np.ndarray, sampling_rate: int) -> str:
+        if len(samples) / sampling_rate < MIN_AUDIO_DURATION:
             # return empty string if audio is too short
             return ''
         
-        with open(audio_path, 'rb') as f:
-            response = self.client.audio.transcriptions.create(
-                model='whisper-1',
-                file=f,
-            )
+        return self._transcribe(samples, sampling_rate).text
+    
+    # override
+    def call_with_timestamps(self, samples: np.ndarray, sampling_rate: int) -> List[Tuple[float, float, str]]:
+        if len(samples) / sampling_rate < MIN_AUDIO_DURATION:
+            return []
+        
+        response = self._transcribe(samples, sampling_rate, response_format='verbose_json')
+        
+        # segments are dicts in older versions of the client
+        segments = [segment if isinstance(segment, dict) else segment.model_dump() for segment in (response.segments or [])]
+        
+        return [(float(segment['start']), float(segment['end']), segment['text']) for segment in segments]
+    
+    def _transcribe(self, samples: np.ndarray, sampling_rate: int, **kwargs):
+        if sampling_rate != ASR_SAMPLING_RATE:
+            logging.debug(f'Uploading audio sampled at {sampling_rate} Hz; {ASR_SAMPLING_RATE} Hz is enough for speech.')
+        
+        data, extension = encode_compact_audio(samples, sampling_rate)
         
-        return response.text
+        return self.client.audio.transcriptions.create(
+            model='whisper-1',
+            # the file name tells the API the format of the content
+            file=(f'audio{extension}', data),
+            **kwargs
+        )
     
     @staticmethod
     def get_description() -> str:
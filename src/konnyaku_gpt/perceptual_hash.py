@@ -0,0 +1,88 @@
+"""Perceptual hashing of images, used to find near-duplicate frames."""
+
+from typing import List, Sequence
+import numpy as np
+from PIL import Image
+
+
+def dhash(image: Image.Image, hash_size: int=8) -> int:
+    """Computes the difference hash of an image.
+
+    The image is shrunk to a (hash_size + 1) x hash_size grayscale thumbnail,
+    and each bit of the hash tells whether a pixel is brighter than its right neighbor.
+    Similar images have hashes with a small Hamming distance.
+
+    Args:
+        image (Image.Image): The image.
+        hash_size (int, optional): The hash has `hash_size ** 2` bits. Defaults to 8.
+
+    Returns:
+        int: The hash.
+    """
+
+    thumbnail = np.asarray(image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR), dtype=np.int16)
+    bits = (thumbnail[:, 1:] > thumbnail[:, :-1]).ravel()
+
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def is_flat(image: Image.Image, max_std: float=2.0) -> bool:
+    """Tells whether an image is (nearly) a single colour, e.g., a black, white, or solid-colour frame.
+
+    The `dhash` of such an image is 0 whatever its colour, so flat images cannot be told apart by their hashes.
+
+    Args:
+        image (Image.Image): The image.
+        max_std (float, optional): The maximum standard deviation of the pixel values (0 - 255) in each channel. Defaults to 2.
+    """
+
+    pixels = np.asarray(image.convert('RGB').resize((32, 32), Image.BILINEAR), dtype=np.float32)
+
+    return bool(pixels.reshape(-1, 3).std(axis=0).max() <= max_std)
+
+
+def hamming_distances(hashes: np.ndarray, target: int) -> np.ndarray:
+    """Computes the Hamming distances between 64-bit hashes (uint64 array) and a hash."""
+
+    xor = np.bitwise_xor(hashes.astype(np.uint64), np.uint64(target))
+
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def group_near_duplicates(hashes: List[int], max_distance: int, ungrouped: Sequence[bool] | None=None) -> List[int]:
+    """Groups 64-bit hashes whose Hamming distance from the first hash of a group is at most `max_distance`.
+
+    Each hash joins the group of the nearest earlier group head within `max_distance`, or starts a new group.
+
+    Args:
+        hashes (List[int]): The hashes (e.g., from `dhash` with the default `hash_size`).
+        max_distance (int): The maximum Hamming distance to the head of a group.
+        ungrouped (Sequence[bool] | None, optional): Flags the hashes which always form a group of their own,
+            e.g., those of flat images (see `is_flat`). "None" means none. Defaults to None.
+
+    Returns:
+        List[int]: For each hash, the index of the head of its group (itself if it starts a group).
+    """
+
+    heads: List[int] = []
+    head_hashes = np.zeros(0, dtype=np.uint64)
+    group_heads = []
+
+    for i, h in enumerate(hashes):
+        if ungrouped is not None and ungrouped[i]:
+            group_heads.append(i)
+            continue
+
+        if len(heads) > 0:
+            distances = hamming_distances(head_hashes, h)
+            nearest = int(np.argmin(distances))
+
+            if distances[nearest] <= max_distance:
+                group_heads.append(heads[nearest])
+                continue
+
+        heads.append(i)
+        head_hashes = np.append(head_hashes, np.uint64(h))
+        group_heads.append(i)
+
+    return group_heads
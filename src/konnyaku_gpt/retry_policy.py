@@ -0,0 +1,237 @@
+"""A retry policy shared by all the layers that call LLMs (models, group correctors, many-clips correctors).
+
+Each layer only retries the kinds of errors it can fix by retrying
+(e.g., models retry rate limits and timeouts, correctors retry unparsable outputs),
+and all retries within a group of clips or a run draw from the same budgets,
+so retries never multiply across layers.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Awaitable, Collection, Iterator, TypeVar
+import asyncio
+import logging
+import random
+import threading
+import time
+import warnings
+
+import openai
+
+from .accounting import UsageAccountant, ANY_MODEL
+
+T = TypeVar('T')
+
+
+class GenerationStoppedError(Exception):
+    """Raised when an LLM stops generating for a reason other than completing its response (e.g., the length limit)."""
+
+    def __init__(self, message: str, stop_reason: str):
+        super().__init__(message)
+
+        self.stop_reason = stop_reason
+
+
+class ResponseParseError(Exception):
+    """Raised when the output of an LLM cannot be parsed into the expected structure."""
+
+
+class RetryBudgetExhaustedError(Exception):
+    """Raised instead of retrying when the retry budget of the group or the run is used up."""
+
+
+class ErrorKinds:
+    """The kinds of errors that the retry policy distinguishes."""
+
+    RATE_LIMIT = 'rate-limit'
+    TIMEOUT = 'timeout'
+    # connection errors and server-side (5xx) errors
+    API_ERROR = 'api-error'
+    # the output hit the length limit; retrying the same request would hit it again,
+    # so it is handled by making the request smaller (see `ManyClipsBatchedCorrector`)
+    LENGTH_STOP = 'length-stop'
+    PARSE_FAILURE = 'parse-failure'
+    OTHER = 'other'
+
+    # the errors of requests, which are retried with backoff
+    TRANSIENT = (RATE_LIMIT, TIMEOUT, API_ERROR)
+
+
+class _RetryBudget:
+    def __init__(self, max_retries: int | None):
+        self.max_retries = max_retries
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.max_retries is not None and self.retries >= self.max_retries:
+                return False
+
+            self.retries += 1
+            return True
+
+
+_current_run_budget: ContextVar[_RetryBudget | None] = ContextVar('current_run_budget', default=None)
+_current_group_budget: ContextVar[_RetryBudget | None] = ContextVar('current_group_budget', default=None)
+# set while retrying an operation whose previous attempt got an unusable output (e.g., unparsable),
+# so that the same output is not replayed from a response cache
+_refreshing_responses: ContextVar[bool] = ContextVar('refreshing_responses', default=False)
+
+
+def refreshing_responses() -> bool:
+    """Whether the current operation is a retry after an unusable output, so that cached responses must not be reused for it."""
+
+    return _refreshing_responses.get()
+
+
+class RetryPolicy:
+    """Retries operations on chosen kinds of errors, with exponential backoff with jitter and budgets of retries.
+
+    Budgets are scoped with `run_scope` and `group_scope`, and are seen by all the operations run within the scope
+    (including those in threads started with `asyncio.to_thread` and in asyncio tasks, which copy the context).
+
+    An attempt made after an error of a non-transient kind (i.e., the output was unusable) runs with `refreshing_responses()` set,
+    so that response caches send the requests again and overwrite their entries instead of replaying the same output.
+    """
+
+    def __init__(self, max_attempts: int=3, max_retries_per_group: int | None=4, max_retries_per_run: int | None=None,
+                 base_delay: float=1.0, max_delay: float=60.0, accountant: UsageAccountant | None=None):
+        """Constructor.
+
+        Args:
+            max_attempts (int, optional): The maximum number of attempts of one operation. Defaults to 3.
+            max_retries_per_group (int | None, optional): The maximum number of retries (of any layer) in a `group_scope`.
+                "None" means unlimited. Defaults to 4.
+            max_retries_per_run (int | None, optional): The maximum number of retries (of any layer) in a `run_scope`.
+                "None" means unlimited. Defaults to None.
+            base_delay (float, optional): The backoff (in seconds) before the first retry of a transient error; it doubles on each retry.
+                The actual delay is drawn uniformly between 0 and the backoff. Defaults to 1.
+            max_delay (float, optional): The maximum backoff, in seconds. Defaults to 60.
+            accountant (UsageAccountant | None, optional): Records each retry in the current stage. Defaults to None.
+        """
+
+        assert max_attempts >= 1, f'max_attempts must be positive, but got {max_attempts}!'
+
+        self.max_attempts = max_attempts
+        self.max_retries_per_group = max_retries_per_group
+        self.max_retries_per_run = max_retries_per_run
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.accountant = accountant
+
+    @staticmethod
+    def classify(error: BaseException) -> str:
+        """Classifies an error into one of `ErrorKinds`."""
+
+        match error:
+            case openai.RateLimitError():
+                return ErrorKinds.RATE_LIMIT
+            # a subclass of `APIConnectionError`
+            case openai.APITimeoutError():
+                return ErrorKinds.TIMEOUT
+            case openai.APIConnectionError() | openai.InternalServerError():
+                return ErrorKinds.API_ERROR
+            case GenerationStoppedError(stop_reason='length'):
+                return ErrorKinds.LENGTH_STOP
+            case ResponseParseError():
+                return ErrorKinds.PARSE_FAILURE
+            case _:
+                return ErrorKinds.OTHER
+
+    @contextmanager
+    def run_scope(self) -> Iterator[None]:
+        """Starts a new retry budget of `max_retries_per_run` for the operations run within the scope."""
+
+        token = _current_run_budget.set(_RetryBudget(self.max_retries_per_run))
+        try:
+            yield
+        finally:
+            _current_run_budget.reset(token)
+
+    @contextmanager
+    def group_scope(self) -> Iterator[None]:
+        """Starts a new retry budget of `max_retries_per_group` for the operations run within the scope."""
+
+        token = _current_group_budget.set(_RetryBudget(self.max_retries_per_group))
+        try:
+            yield
+        finally:
+            _current_group_budget.reset(token)
+
+    def _next_delay(self, error: BaseException, kind: str, attempt: int, retry_on: Collection[str], model_name: str | None) -> float:
+        """Decides whether to retry after a failed attempt (0-indexed), and returns the delay (in seconds) before retrying.
+
+        Raises the error (or `RetryBudgetExhaustedError`) if it should not be retried.
+        """
+
+        if kind not in retry_on or attempt + 1 >= self.max_attempts:
+            raise error
+
+        for scope, budget in (('group', _current_group_budget.get()), ('run', _current_run_budget.get())):
+            if budget is not None and not budget.try_spend():
+                raise RetryBudgetExhaustedError(f'Retry budget of the {scope} ({budget.max_retries}) used up; last error ({kind}): {error}') from error
+
+        # only the errors of requests need backoff; e.g., an unparsable output can be retried at once
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)) if kind in ErrorKinds.TRANSIENT else 0.0
+
+        if self.accountant is not None:
+            self.accountant.record_retry(model_name if model_name is not None else ANY_MODEL)
+
+        logging.warning(f'Attempt {attempt + 1}/{self.max_attempts} failed ({kind}: {error}); retrying in {delay:.2f}s')
+
+        return delay
+
+    def call(self, operation: Callable[[], T], retry_on: Collection[str], model_name: str | None=None) -> T:
+        """Runs an operation, retrying it on some kinds of errors.
+
+        Args:
+            operation (Callable[[], T]): The operation.
+            retry_on (Collection[str]): The kinds of errors (values in `ErrorKinds`) to retry on. Other errors are raised at once.
+            model_name (str | None, optional): The model that the retries are attributed to in the accountant.
+                "None" means `ANY_MODEL`, e.g., for operations involving several models. Defaults to None.
+
+        Returns:
+            T: The return value of the operation.
+        """
+
+        refresh = False
+
+        for attempt in range(self.max_attempts):
+            token = _refreshing_responses.set(True) if refresh else None
+            try:
+                return operation()
+            except Exception as e:
+                kind = self.classify(e)
+                time.sleep(self._next_delay(e, kind, attempt, retry_on, model_name))
+                refresh = refresh or kind not in ErrorKinds.TRANSIENT
+            finally:
+                if token is not None:
+                    _refreshing_responses.reset(token)
+
+    async def acall(self, operation: Callable[[], Awaitable[T]], retry_on: Collection[str], model_name: str | None=None) -> T:
+        """Like `call`, but for an asynchronous operation; waits without blocking the event loop."""
+
+        refresh = False
+
+        for attempt in range(self.max_attempts):
+            token = _refreshing_responses.set(True) if refresh else None
+            try:
+                return await operation()
+            except Exception as e:
+                kind = self.classify(e)
+                await asyncio.sleep(self._next_delay(e, kind, attempt, retry_on, model_name))
+                refresh = refresh or kind not in ErrorKinds.TRANSIENT
+            finally:
+                if token is not None:
+                    _refreshing_responses.reset(token)
+
+
+def policy_from_deprecated_count(argument_name: str, **policy_arguments) -> RetryPolicy:
+    """Builds the retry policy equivalent to a deprecated retry count argument (e.g., `max_retry_count`), warning about its use."""
+
+    # the warning points at the code constructing the layer that takes the deprecated argument
+    warnings.warn(f'`{argument_name}` is deprecated and will be removed; pass a `RetryPolicy` as `retry_policy` instead.',
+                  DeprecationWarning, stacklevel=3)
+
+    return RetryPolicy(**policy_arguments)
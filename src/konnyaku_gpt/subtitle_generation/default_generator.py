@@ -2,6 +2,7 @@
 
 import logging
 from pathlib import Path
+from typing import Dict, Tuple
 from .subtitle_generator import SubtitleGenerator
 from .multimedia_llm_subtitle_generator import MultiMediaLlmSubtitleGenerator
 from ..many_clips_transcription_correction import ManyClipsBatchedCorrector
@@ -9,6 +10,8 @@ from ..transcription_correction import SimpleCorrector, MultiRoundCorrector
 from ..models.gpt import OpenAiGptServer, GPT35Turbo, GPT4
 from ..models.whisper_cloud import WhisperCloud
 from ..models.blip_large import BlipLarge
+from ..cache import ContentCache
+from ..retry_policy import RetryPolicy
 
 
 class DefaultGenerator(SubtitleGenerator):
@@ -21,7 +24,8 @@ class DefaultGenerator(SubtitleGenerator):
         HIGH = 'high'
         VERY_HIGH = 'very-high'
     
-    def __init__(self, quality_preset: str=QualityPresets.MEDIUM):
+    def __init__(self, quality_preset: str=QualityPresets.MEDIUM, llm_cache_path: Path | None=None,
+                 llm_rate_limits: Dict[str, Tuple[float, float]] | None=None, silence_threshold_db: float | None=None):
         """Constructs a default generator.
 
         Args:
@@ -33,47 +37,65 @@ class DefaultGenerator(SubtitleGenerator):
                 "high" quality generator uses multi-round correction and employs GPT-4 to analyze the plot and suggest fixes to transcriptions.
                 "very-high" quality generator uses multi-round correction and employs GPT-4 to analyze the plot, suggest fixes to transcriptions, and translate the transcriptions.
                 The typical costs of "low", "medium", and "high" quality generators on a 20-minute video are $0.7, $4.5 and $15 (not tested), respectively.
+            llm_cache_path (Path | None, optional): The SQLite file caching the responses of the LLMs.
+                Re-running on the same inputs (e.g., after a crash) then replays the cached responses instead of paying for them again.
+                "None" means no caching. Defaults to None.
+            llm_rate_limits (Dict[str, Tuple[float, float]] | None, optional): The rate limits of the OpenAI account,
+                as {model name: (requests per minute, tokens per minute)}, e.g., `OpenAiGptServer.tier_1_rate_limits`,
+                to throttle requests client-side (see `OpenAiGptServer`). "None" means no client-side limiting. Defaults to None.
+            silence_threshold_db (float | None, optional): Clips quieter than this (in dB relative to full scale) are not transcribed,
+                e.g., `DEFAULT_SILENCE_THRESHOLD_DB` (see `MultiMediaLlmSubtitleGenerator.generate_subtitles`).
+                "None" means transcribing all clips. Defaults to None.
         """
         
-        self._gpt_server = OpenAiGptServer()
+        self._silence_threshold_db = silence_threshold_db
+        self._llm_cache = ContentCache(llm_cache_path) if llm_cache_path is not None else None
+        self._gpt_server = OpenAiGptServer(rate_limits=llm_rate_limits, response_cache=self._llm_cache)
+        # shared by all layers, so that their retries draw from the same budgets
+        self._retry_policy = RetryPolicy(accountant=self._gpt_server.accountant)
 
         # instantiate correctors based on quality preset
         match quality_preset:
             case self.QualityPresets.LOW:
                 self._group_corrector = SimpleCorrector(
-                    correction_backend=GPT35Turbo(self._gpt_server, context_length='16k'),
-                    extraction_backend=GPT35Turbo(self._gpt_server, context_length='16k')
+                    correction_backend=GPT35Turbo(self._gpt_server, context_length='16k', retry_policy=self._retry_policy),
+                    extraction_backend=GPT35Turbo(self._gpt_server, context_length='16k', retry_policy=self._retry_policy),
+                    retry_policy=self._retry_policy
                 )
             case self.QualityPresets.MEDIUM:
                 self._group_corrector = SimpleCorrector(
-                    correction_backend=GPT4(self._gpt_server, context_length='8k'),
-                    extraction_backend=GPT35Turbo(self._gpt_server, context_length='16k')
+                    correction_backend=GPT4(self._gpt_server, context_length='8k', retry_policy=self._retry_policy),
+                    extraction_backend=GPT35Turbo(self._gpt_server, context_length='16k', retry_policy=self._retry_policy),
+                    retry_policy=self._retry_policy
                 )
             case self.QualityPresets.HIGH:
                 self._group_corrector = MultiRoundCorrector(
-                    plot_analysis_backend=GPT4(self._gpt_server, context_length='8k'),
-                    fix_suggestion_backend=GPT4(self._gpt_server, context_length='8k'),
-                    fix_application_backend=GPT35Turbo(self._gpt_server, context_length='16k'),
-                    translation_backend=GPT35Turbo(self._gpt_server, context_length='16k'),
-                    transcription_extraction_backend=GPT35Turbo(self._gpt_server, context_length='16k'),
+                    plot_analysis_backend=GPT4(self._gpt_server, context_length='8k', retry_policy=self._retry_policy),
+                    fix_suggestion_backend=GPT4(self._gpt_server, context_length='8k', retry_policy=self._retry_policy),
+                    fix_application_backend=GPT35Turbo(self._gpt_server, context_length='16k', retry_policy=self._retry_policy),
+                    translation_backend=GPT35Turbo(self._gpt_server, context_length='16k', retry_policy=self._retry_policy),
+                    transcription_extraction_backend=GPT35Turbo(self._gpt_server, context_length='16k', retry_policy=self._retry_policy),
+                    retry_policy=self._retry_policy
                 )
             case self.QualityPresets.VERY_HIGH:
                 self._group_corrector = MultiRoundCorrector(
-                    plot_analysis_backend=GPT4(self._gpt_server, context_length='8k'),
-                    fix_suggestion_backend=GPT4(self._gpt_server, context_length='8k'),
-                    fix_application_backend=GPT35Turbo(self._gpt_server, context_length='16k'),
-                    translation_backend=GPT4(self._gpt_server, context_length='32k'),
-                    transcription_extraction_backend=GPT35Turbo(self._gpt_server, context_length='16k'),
+                    plot_analysis_backend=GPT4(self._gpt_server, context_length='8k', retry_policy=self._retry_policy),
+                    fix_suggestion_backend=GPT4(self._gpt_server, context_length='8k', retry_policy=self._retry_policy),
+                    fix_application_backend=GPT35Turbo(self._gpt_server, context_length='16k', retry_policy=self._retry_policy),
+                    translation_backend=GPT4(self._gpt_server, context_length='32k', retry_policy=self._retry_policy),
+                    transcription_extraction_backend=GPT35Turbo(self._gpt_server, context_length='16k', retry_policy=self._retry_policy),
+                    retry_policy=self._retry_policy
                 )
             case _:
                 raise Exception(f'Unknown quality preset:{quality_preset} ')
         
-        self._many_clips_transcription_corrector = ManyClipsBatchedCorrector(self._group_corrector)
+        self._many_clips_transcription_corrector = ManyClipsBatchedCorrector(self._group_corrector, retry_policy=self._retry_policy)
         
         self._subtitle_generator = MultiMediaLlmSubtitleGenerator(
-            audio_transcriber_instantiator=lambda: WhisperCloud(),
-            frame_describer_instantiator=lambda: BlipLarge(),
-            transcription_corrector_instantiator=lambda: self._many_clips_transcription_corrector
+            audio_transcriber_instantiator=WhisperCloud,
+            frame_describer_instantiator=BlipLarge,
+            transcription_corrector_instantiator=lambda: self._many_clips_transcription_corrector,
+            usage_accountant=self._gpt_server.accountant
         )
 
     # override
@@ -88,14 +110,18 @@ class DefaultGenerator(SubtitleGenerator):
             workspace_path (Path | None, optional): The workspace path. Defaults to None.
                 If None, then the workspace is created in the directory that contains the video,
                 with the folder name being <video-base-name>_workspace.
+                The usage of the LLMs (tokens, cost, latency and retries per model and stage) is written to "usage_report.json" in it.
         """
         
-        start_money = self._gpt_server.money_spent["total"]
+        if workspace_path is None:
+            workspace_path = video_path.absolute().resolve().parent / f'{video_path.stem}_workspace'
+
+        start_money = self._gpt_server.accountant.total_cost
         current_money_spent = 0
         
         def on_group_complete():
             nonlocal current_money_spent
-            new_total = self._gpt_server.money_spent["total"] - start_money
+            new_total = self._gpt_server.accountant.total_cost - start_money
             logging.info(f'Cost on this group: ${new_total - current_money_spent: .2e}')
             current_money_spent = new_total
             logging.info(f'Total money spent: ${current_money_spent: .2e}')
@@ -103,10 +129,13 @@ class DefaultGenerator(SubtitleGenerator):
         self._subtitle_generator.generate_subtitles(
             video_path=video_path, output_path=output_path, video_background=video_background, target_language=target_language,
             workspace_path=workspace_path,
-            split_clip_rtol=0.4, save_every=10, corrector_extra_arguments={
+            split_clip_rtol=0.4, save_every=10, silence_threshold_db=self._silence_threshold_db, corrector_extra_arguments={
                 'min_target_clips_length': 40,
                 'min_pre_context_length': 10,
                 'min_post_context_length': 10,
                 'group_completion_callback': on_group_complete
             }
         )
+
+        if self._llm_cache is not None:
+            logging.info(f'LLM response cache: {self._llm_cache.hits} hits, {self._llm_cache.misses} misses')
@@ -6,11 +6,13 @@ from typing import Sequence, Dict, List, Tuple, Any, Callable
 import logging
 
 from .subtitle_generator import SubtitleGenerator
-from ..models import TranscriberModelService, ImageToTextModelService
+from ..models import TranscriberModelService, ImageToTextModelService, ModelRegistry
 from ..many_clips_transcription_correction import ManyClipsTranscriptionCorrector
-from ..utils import compile_video_for_llm
+from ..utils import compile_video_for_llm, SplitModes
+from ..cache import ContentCache
 from ..data_models import ClipData, ClipSetMetadata
 from ..srt_export import export_to_srt
+from ..accounting import UsageAccountant, dump_usage_report
 
 
 class MultiMediaLlmSubtitleGenerator(SubtitleGenerator):
@@ -18,28 +20,41 @@ class MultiMediaLlmSubtitleGenerator(SubtitleGenerator):
     def __init__(self,
                  audio_transcriber_instantiator: Callable[[], TranscriberModelService],
                  frame_describer_instantiator: Callable[[], ImageToTextModelService],
-                 transcription_corrector_instantiator: Callable[[], ManyClipsTranscriptionCorrector]):
+                 transcription_corrector_instantiator: Callable[[], ManyClipsTranscriptionCorrector],
+                 usage_accountant: UsageAccountant | None=None):
         """Constructor.
 
         Args:
             audio_transcriber_instantiator (Callable[[], TranscriberModelService]): Audio transcriber instantiator.
                 The return value of this instantiator is used as the ASR model for audio transcription.
+                Pass the model class itself (e.g., `WhisperCloud`) so that its description can be read without constructing it.
             frame_describer_instantiator (Callable[[], ImageToTextModelService]): Frame describer instantiator.
                 The return value of this instantiator is used as the model for image captioning.
+                Pass the model class itself (e.g., `BlipLarge`) so that its description can be read without constructing it.
             corrector (TranscriptionCorrector): Transcription corrector instantiator.
                 The return value of this instantiator is used as the corrector for correcting the transcriptions from multi-media information input.
+            usage_accountant (UsageAccountant | None, optional): The accountant of the LLMs used by the corrector.
+                If given, the usage of each run (tokens, cost, latency and retries per model and stage) is written to "usage_report.json"
+                in the workspace, even if the run fails. Defaults to None.
         """
         
         super().__init__()
         
-        self._audio_transcriber_instantiator = audio_transcriber_instantiator
-        self._frame_describer_instantiator = frame_describer_instantiator
+        # the models are constructed at most once until they are unloaded
+        self._model_registry = ModelRegistry()
+        self._model_registry.register('audio-transcriber', audio_transcriber_instantiator)
+        self._model_registry.register('frame-describer', frame_describer_instantiator)
         self._transcription_corrector_instantiator = transcription_corrector_instantiator
+        self._usage_accountant = usage_accountant
     
     # override
     def generate_subtitles(self, video_path: Path, output_path: Path, video_background: str, target_language: str | None=None,
                            workspace_path: Path | None=None, split_clip_rtol: float=0.4, save_every: int=10,
-                           corrector_extra_arguments: Dict[str, Any]={}):
+                           corrector_extra_arguments: Dict[str, Any]={}, split_mode: str=SplitModes.REENCODE,
+                           split_extra_arguments: Dict[str, Any]={}, transcription_workers: int | None=None,
+                           inference_batch_size: int=1, transcription_coalesce_duration: float | None=None,
+                           inference_cache: ContentCache | None=None, caption_dedupe_max_distance: int | None=None,
+                           concurrent_stages: bool=True, keep_models_loaded: bool=False, silence_threshold_db: float | None=None):
         """Generates subtitles for a video.
 
         Args:
@@ -55,6 +70,29 @@ class MultiMediaLlmSubtitleGenerator(SubtitleGenerator):
                 Must be between 0 and 1.
             save_every (int, optional): When compiling the transcriptions & frame descriptions, automatic saving will occur every `save_every` clips.
             corrector_extra_arguments (Dict[str, Any], optional): Extra named arguments to pass to the corrector.
+            split_mode (str, optional): How the video is split into clips. One of the values in `SplitModes`.
+                "virtual" avoids writing clip files to the workspace. Defaults to "reencode".
+            split_extra_arguments (Dict[str, Any], optional): Extra named arguments to pass to `split_video`,
+                e.g., `{'encoding_workers': 8}` to encode clips in parallel in "reencode" mode.
+            transcription_workers (int | None, optional): The number of clips transcribed concurrently.
+                Only use it with thread-safe transcribers, e.g., the cloud Whisper. "None" means one clip at a time. Defaults to None.
+            inference_batch_size (int, optional): The number of clips passed to the transcriber and the frame describer at once.
+                Batching speeds up local models, e.g., on CPU. Defaults to 1.
+            transcription_coalesce_duration (float | None, optional): The maximum duration (in seconds) of a run of adjacent clips
+                transcribed with a single request, e.g., 30. Fewer, longer requests also keep speech across cuts intact.
+                "None" means one request per clip. Defaults to None.
+            inference_cache (ContentCache | None, optional): A cache of transcriptions and frame descriptions keyed by content.
+                Pass the same cache for all episodes of a series to reuse the results for their opening and ending. Defaults to None.
+            caption_dedupe_max_distance (int | None, optional): Clips whose frames are near-duplicates
+                (perceptual hashes within this Hamming distance, e.g., 4) share one frame description.
+                "None" means describing every frame. Defaults to None.
+            concurrent_stages (bool, optional): Whether to transcribe the clips and describe their frames at the same time.
+                Disable it if both models compete for the same device. Defaults to True.
+            keep_models_loaded (bool, optional): Whether to keep the transcriber and the frame describer loaded after the compilation,
+                e.g., to reuse them for the next episode. Otherwise, they are unloaded before correcting the transcriptions. Defaults to False.
+            silence_threshold_db (float | None, optional): Clips whose audio is quieter than this (in dB relative to full scale),
+                e.g., `DEFAULT_SILENCE_THRESHOLD_DB`, are not transcribed and get empty transcriptions, which saves transcription requests.
+                Quiet speech below the threshold is lost, so it is off by default. "None" means transcribing all clips. Defaults to None.
         """
         
         assert 0 <= split_clip_rtol <= 1, f'split_clip_rtol must be between 0 and 1, but got {split_clip_rtol}!'
@@ -66,40 +104,53 @@ class MultiMediaLlmSubtitleGenerator(SubtitleGenerator):
         if not workspace_path.exists():
             workspace_path.mkdir()
         
-        # split video and generate audio transcriptions & frame descriptions
-        logging.info('Splitting video and generating audio transcriptions & frame descriptions...')
-        multimedia_info_compilation_workspace_path = workspace_path / 'multimedia_info'
-        compile_video_for_llm(video_path, multimedia_info_compilation_workspace_path, self._audio_transcriber_instantiator, self._frame_describer_instantiator, split_clip_rtol, save_every)
-
-        # assemble multimedia information
-        with open(multimedia_info_compilation_workspace_path / 'clips/metadata.json', 'r') as f:
-            clips_metadata: ClipSetMetadata = ClipSetMetadata.from_json(f.read())
+        start_usage = self._usage_accountant.snapshot() if self._usage_accountant is not None else None
         
-        durations = [item.duration for item in clips_metadata.clips_metadata]
+        try:
+            # split video and generate audio transcriptions & frame descriptions
+            logging.info('Splitting video and generating audio transcriptions & frame descriptions...')
+            multimedia_info_compilation_workspace_path = workspace_path / 'multimedia_info'
+            compile_video_for_llm(video_path, multimedia_info_compilation_workspace_path,
+                                  self._model_registry.instantiator('audio-transcriber'), self._model_registry.instantiator('frame-describer'), split_clip_rtol, save_every,
+                                  split_mode=split_mode, split_extra_arguments=split_extra_arguments,
+                                  transcription_workers=transcription_workers, inference_batch_size=inference_batch_size,
+                                  transcription_coalesce_duration=transcription_coalesce_duration, inference_cache=inference_cache,
+                                  caption_dedupe_max_distance=caption_dedupe_max_distance, concurrent_stages=concurrent_stages,
+                                  silence_threshold_db=silence_threshold_db)
+
+            # free the memory of the models before the LLM stage
+            if not keep_models_loaded:
+                self._model_registry.unload_all()
+
+            # assemble multimedia information
+            with open(multimedia_info_compilation_workspace_path / 'clips/metadata.json', 'r') as f:
+                clips_metadata: ClipSetMetadata = ClipSetMetadata.from_json(f.read())
+        
+            durations = [item.duration for item in clips_metadata.clips_metadata]
 
-        with open(multimedia_info_compilation_workspace_path / 'transcriptions.json', 'r') as f:
-            transcriptions = json.load(f)
+            with open(multimedia_info_compilation_workspace_path / 'transcriptions.json', 'r') as f:
+                transcriptions = json.load(f)
         
-        with open(multimedia_info_compilation_workspace_path / 'captions.json', 'r') as f:
-            captions = json.load(f)
+            with open(multimedia_info_compilation_workspace_path / 'captions.json', 'r') as f:
+                captions = json.load(f)
         
-        assert isinstance(durations, List) and all(isinstance(d, float) for d in durations), 'Error: malformed durations data'
-        assert isinstance(transcriptions, List) and all(isinstance(t, str) for t in transcriptions), 'Error: incorrect JSON structure in transcriptions data'
-        assert isinstance(captions, List) and all(isinstance(c, str) for c in captions), 'Error: incorrect JSON structure in captions data'
-        assert len(durations) == len(transcriptions) == len(captions), 'Error: lengths of durations, transcriptions, and captions are not the same'
-
-        clips_data = [ClipData(duration, [transcription], caption) for duration, transcription, caption in zip(durations, transcriptions, captions)]
-
-        # correct transcriptions
-        # construct "additional information" from models' descriptions
-        logging.info('Correcting transcriptions...')
-        transcriber_description = self._audio_transcriber_instantiator().get_description()
-        frame_describer_description = self._frame_describer_instantiator().get_description()
+            assert isinstance(durations, List) and all(isinstance(d, float) for d in durations), 'Error: malformed durations data'
+            assert isinstance(transcriptions, List) and all(isinstance(t, str) for t in transcriptions), 'Error: incorrect JSON structure in transcriptions data'
+            assert isinstance(captions, List) and all(isinstance(c, str) for c in captions), 'Error: incorrect JSON structure in captions data'
+            assert len(durations) == len(transcriptions) == len(captions), 'Error: lengths of durations, transcriptions, and captions are not the same'
+
+            clips_data = [ClipData(duration, [transcription], caption) for duration, transcription, caption in zip(durations, transcriptions, captions)]
+
+            # correct transcriptions
+            # construct "additional information" from models' descriptions
+            logging.info('Correcting transcriptions...')
+            transcriber_description = self._model_registry.get_description('audio-transcriber')
+            frame_describer_description = self._model_registry.get_description('frame-describer')
         
-        corrector = self._transcription_corrector_instantiator()
-        corrected_transcriptions = corrector.correct_transcriptions(
-            clips_data, video_background,
-            auxiliary_information=\
+            corrector = self._transcription_corrector_instantiator()
+            corrected_transcriptions = corrector.correct_transcriptions(
+                clips_data, video_background,
+                auxiliary_information=\
 f"""The speech recognition model and image captioning models used to create transcriptions and frame descriptions may have special quirks that produce inaccurate outputs in particular ways.
 
 For your reference, here is a description of the speech recognition model:
@@ -116,18 +167,22 @@ Here is a description of the image captioning model:
 
 Pay attention to the special behavior of the models; the models' quirks may result in inaccurate and even misleading outputs.
 """,
-            target_language=target_language,
-            cache_path=workspace_path / 'transcription_correction_cache',
-            **corrector_extra_arguments
-        )
+                target_language=target_language,
+                cache_path=workspace_path / 'transcription_correction_cache',
+                **corrector_extra_arguments
+            )
         
-        # export subtitles
-        logging.info('Exporting subtitles...')
-        srt_string = export_to_srt(clips_metadata.clips_metadata, corrected_transcriptions)
+            # export subtitles
+            logging.info('Exporting subtitles...')
+            srt_string = export_to_srt(clips_metadata.clips_metadata, corrected_transcriptions)
 
-        output_path.touch()
+            output_path.touch()
         
-        with open(output_path, 'w') as f:
-            f.write(srt_string)
+            with open(output_path, 'w') as f:
+                f.write(srt_string)
         
-        logging.info('Subtitle generation complete.')
+            logging.info('Subtitle generation complete.')
+        finally:
+            # the usage is reported even if the run fails, e.g., to see what a crashed run has cost
+            if self._usage_accountant is not None:
+                dump_usage_report(self._usage_accountant.snapshot_since(start_usage), workspace_path / 'usage_report.json')
@@ -3,6 +3,8 @@ from typing import Sequence, Dict, List, Any, Tuple, Callable
 from ..data_models import ClipData
 from .transcription_corrector import TranscriptionCorrector
 from ..models.chat_completion import ChatCompletionService
+from ..retry_policy import RetryPolicy, ErrorKinds, ResponseParseError, policy_from_deprecated_count
+from ..accounting import llm_stage
 
 
 class MultiRoundCorrector(TranscriptionCorrector):
@@ -26,7 +28,8 @@ class MultiRoundCorrector(TranscriptionCorrector):
                  fix_application_backend: ChatCompletionService,
                  translation_backend: ChatCompletionService,
                  transcription_extraction_backend: ChatCompletionService,
-                 max_retry_count: int=3):
+                 retry_policy: RetryPolicy | None=None,
+                 max_retry_count: int | None=None):
         """Constructor.
 
         Args:
@@ -35,7 +38,10 @@ class MultiRoundCorrector(TranscriptionCorrector):
             fix_application_backend (ChatCompletionService): Chat completion service used to correct the transcriptions and produce the corrected transcriptions, based on the proposed fixes.
             translation_backend (ChatCompletionService): Chat completion service used to translate the transcriptions.
             transcription_extraction_backend (ChatCompletionService): Chat completion service used to convert the revised transcriptions into machine-readable form.
-            max_retry_count (int, optional): The maximum number to retry on each group of clips. Defaults to 3.
+            retry_policy (RetryPolicy | None, optional): Retries the conversation when the extraction output cannot be parsed.
+                "None" means a default policy. Defaults to None.
+            max_retry_count (int | None, optional): Deprecated; the maximum number of attempts of the conversation.
+                Equivalent to `retry_policy=RetryPolicy(max_attempts=max_retry_count)`. Defaults to None.
         """
 
         super().__init__()
@@ -45,25 +51,29 @@ class MultiRoundCorrector(TranscriptionCorrector):
         self.fix_application_backend = fix_application_backend
         self.translation_backend = translation_backend
         self.transcription_extraction_backend = transcription_extraction_backend
-        self.max_retry_count = max_retry_count
+        assert retry_policy is None or max_retry_count is None, 'Pass either retry_policy or the deprecated max_retry_count, not both!'
+
+        if max_retry_count is not None:
+            retry_policy = policy_from_deprecated_count('max_retry_count', max_attempts=max_retry_count)
+
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
     
     # override
     def correct_transcriptions(self, clips_data: Sequence[ClipData], video_background: str, auxiliary_information: str, target_language: str | None = None) -> Sequence[str]:
-        for _ in range(self.max_retry_count):
-            try:
-                def format_clip(index: int, transcription: str, caption: str) -> str:
-                    return \
+        def attempt() -> List[str]:
+            def format_clip(index: int, transcription: str, caption: str) -> str:
+                return \
 f"""Clip {index}:
 (Inaccurate) transcription: {transcription}
 (Inaccurate) description of an arbitrarily picked frame: {caption}"""
         
-                clip_args = [(i, '\n'.join(item.audio_transcriptions_raw), item.screenshot_description) for i, item in enumerate(clips_data)]
-                clips_data_part = ('\n' * 2).join(format_clip(*args) for args in clip_args)
-                
-                chat_history = []
-                
-                # step 1: plot analysis
-                analysis_prompt = \
+            clip_args = [(i, '\n'.join(item.audio_transcriptions_raw), item.screenshot_description) for i, item in enumerate(clips_data)]
+            clips_data_part = ('\n' * 2).join(format_clip(*args) for args in clip_args)
+            
+            chat_history = []
+            
+            # step 1: plot analysis
+            analysis_prompt = \
 f"""I am creating subtitles for a video. I splitted it into clips and used speech recognition to create transcriptions for each clip. I also used an image-to-text model to create a description of an arbitrarily picked frame in each clip.
 
 The transcriptions and frame descriptions are:
@@ -102,46 +112,50 @@ Pay attention to the special behavior of the speech recognition model and the im
 
 OUTPUT THE SUMMARY OF STORYLINE FIRST; USE INFORMATION FROM OTHER CLIPS AND THE GENERAL PLOT TO HELP YOU DETERMINE WHAT IS GOING ON IN EACH CLIP. SOME CLIPS MAY NOT MAKE SENSE ON THEIR OWN."""
 
-                chat_history.append((analysis_prompt, True))
+            chat_history.append((analysis_prompt, True))
+            with llm_stage('plot-analysis'):
                 analysis_result = self.plot_analysis_backend(chat_history)
-                chat_history.append((analysis_result, False))
-                
-                # step 2: suggest fixes
-                fix_suggestion_prompt = \
+            chat_history.append((analysis_result, False))
+            
+            # step 2: suggest fixes
+            fix_suggestion_prompt = \
 """Looking at the background information and your analysis, please identify possible errors in the transcriptions, infer what the erroneous words / phrases / transcriptions might actually be, and suggest a replacement that fits into the context and makes sense to you for each of them.
 
 You may want to look back at the background information and identify special terms that may occur. If you see a phrase that looks especially strange or does not fit into its context, it is likely a misrecognized special term, like a character name. Also, sometimes speech recognition can recognize the presence of a special term, but because it has no access to background information, the result is likely a misspelled special term. You should suggest the correct replacement for misrecognized or misspelled special terms as well.
 
 You may want to pay attention to special behavior of the speech recognition model and the image-to-text model. They may have special quirks that produce incorrect and even misleading information."""
-                chat_history.append((fix_suggestion_prompt, True))
+            chat_history.append((fix_suggestion_prompt, True))
+            with llm_stage('fix-suggestion'):
                 fix_suggestion_result = self.fix_suggestion_backend(chat_history)
-                chat_history.append((fix_suggestion_result, False))
+            chat_history.append((fix_suggestion_result, False))
 
-                # step 3: apply fixes
-                fix_application_prompt = \
+            # step 3: apply fixes
+            fix_application_prompt = \
 """Now, applying the corrections you suggested, please provide a better version of the transcriptions for all the clips. Please also correct any errors that you did not identify previously (pay extra attention to potential special terms). Provide the corrected transcriptions ONLY."""
-                chat_history.append((fix_application_prompt, True))
+            chat_history.append((fix_application_prompt, True))
+            with llm_stage('fix-application'):
                 fix_application_result = self.fix_application_backend(chat_history)
-                chat_history.append((fix_application_result, False))
+            chat_history.append((fix_application_result, False))
 
-                # step 4: translate (if applicable)
-                if target_language is not None:
-                    translation_prompt = \
+            # step 4: translate (if applicable)
+            if target_language is not None:
+                translation_prompt = \
 """Now, please translate the translations into simplified Chinese. You should take into account all information you have and all analysis you have done to ensure that the translated transcriptions ARE LOGICALLY CONNECTED and SOUND NATURAL TO NATIVE SPEAKERS. Also, make sure to translate special terms correctly; you may need to refer to the background information to see how to translate each special term.
 
 You should correct the phrases that do not make sense or do not fit into their context if there are still such phrases after your correction. In case you really cannot infer what the correct transcription is, you should use your imagination and contextual information to write a transcription by yourself. The priority is to make the transcriptions sound NATURAL and look LOGICALLY CONNECTED, NOT to translate the speech recognition outputs as is. Speech recognition outputs can be very inaccurate.
 
 Output the translated transcriptions ONLY and NOTHING ELSE. You should include transcriptions for all the clips, including those you did not modify."""
-                    chat_history.append((translation_prompt, True))
+                chat_history.append((translation_prompt, True))
+                with llm_stage('translation'):
                     translation_result = self.translation_backend(chat_history)
-                    chat_history.append((translation_result, False))
-
-                    final_transcriptions = translation_result
-                else:
-                    final_transcriptions = fix_application_result
-                
-                # step 5: convert natural language transcriptions into JSON
-                transcription_extraction_prompt = \
+                chat_history.append((translation_result, False))
+
+                final_transcriptions = translation_result
+            else:
+                final_transcriptions = fix_application_result
+            
+            # step 5: convert natural language transcriptions into JSON
+            transcription_extraction_prompt = \
 f"""I used an LLM to correct transcriptions for a number of audio clips.
 Please format the LLM output into JSON so that I can use some simple code to retrieve the transcriptions in a machine-friendly form.
 
@@ -196,18 +210,19 @@ Then your output should be something like:
 Remember, the transcriptions in your output should be in {target_language if target_language is not None else "their original language"}.
 """
 
-                # no context because this task is easy
+            # no context because this task is easy
+            with llm_stage('extraction'):
                 transcription_extraction_result = self.transcription_extraction_backend([(transcription_extraction_prompt, True)])
 
-                # parse the transcriptions into JSON
+            # parse the transcriptions into JSON
+            try:
                 parsed_transcriptions: Dict[str, str] = json.loads(transcription_extraction_result)
-                assert set(range(len(clips_data))).issuperset(int(key) for key in parsed_transcriptions.keys()), "Invalid clip indices detected in formatted transcriptions!"
                 assert isinstance(parsed_transcriptions, Dict), "Unexpected JSON structure from extraction output!"
+                assert set(range(len(clips_data))).issuperset(int(key) for key in parsed_transcriptions.keys()), "Invalid clip indices detected in formatted transcriptions!"
                 assert all(isinstance(val, str) for val in parsed_transcriptions.values()), "Unexpected JSON structure from extraction output!"
+            except (ValueError, AssertionError) as e:
+                raise ResponseParseError(f'Failed to parse the extracted transcriptions: {e}') from e
 
-                return [parsed_transcriptions.get(str(i), '') for i in range(len(clips_data))]
+            return [parsed_transcriptions.get(str(i), '') for i in range(len(clips_data))]
 
-            except Exception as e:
-                continue
-        
-        raise Exception('Max retry count of {} reached!'.format(self.max_retry_count))
+        return self.retry_policy.call(attempt, retry_on=(ErrorKinds.PARSE_FAILURE,))
@@ -3,6 +3,8 @@ from typing import Sequence, Dict, List, Any, Tuple
 from ..data_models import ClipData
 from .transcription_corrector import TranscriptionCorrector
 from ..models.chat_completion import ChatCompletionService
+from ..retry_policy import RetryPolicy, ErrorKinds, ResponseParseError, policy_from_deprecated_count
+from ..accounting import llm_stage
 
 
 class SimpleCorrector(TranscriptionCorrector):
@@ -11,51 +13,61 @@ class SimpleCorrector(TranscriptionCorrector):
     (one for correction and another for transcription extraction from natural language)
     """
 
-    def __init__(self, correction_backend: ChatCompletionService, extraction_backend: ChatCompletionService, max_try_count: int=3):
+    def __init__(self, correction_backend: ChatCompletionService, extraction_backend: ChatCompletionService, retry_policy: RetryPolicy | None=None,
+                 max_try_count: int | None=None):
         
         """Constructor.
 
         Args:
             correction_backend (ChatCompletionService): The model service used for correction.
             extraction_backend (ChatCompletionService): The model service used for transcription extraction from natural language.
-            max_try_count (int): The maximum number to retry on each group of clips. If reached, exception will be raised.
+            retry_policy (RetryPolicy | None): Retries the correction when the extraction output cannot be parsed. If it gives up, the error is raised.
+                "None" means a default policy.
+            max_try_count (int | None): Deprecated; the maximum number of attempts of the correction.
+                Equivalent to `retry_policy=RetryPolicy(max_attempts=max_try_count)`.
         """
         
         super().__init__()
 
         self.correction_backend = correction_backend
         self.extraction_backend = extraction_backend
-        self.max_retry_count = max_try_count
+        assert retry_policy is None or max_try_count is None, 'Pass either retry_policy or the deprecated max_try_count, not both!'
+
+        if max_try_count is not None:
+            retry_policy = policy_from_deprecated_count('max_try_count', max_attempts=max_try_count)
+
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
     
     # override
     def correct_transcriptions(self, clips_data: Sequence[ClipData], video_background: str, auxiliary_information: str, target_language: str | None = None) -> Sequence[str]:
-        for _ in range(self.max_retry_count):
-            try:
-                correction_prompt = self._build_transcription_correction_prompt(
-                    clips_data=clips_data,
-                    auxiliary_information=auxiliary_information,
-                    video_background=video_background,
-                    target_language=target_language
-                )
+        def attempt() -> List[str]:
+            correction_prompt = self._build_transcription_correction_prompt(
+                clips_data=clips_data,
+                auxiliary_information=auxiliary_information,
+                video_background=video_background,
+                target_language=target_language
+            )
+            with llm_stage('correction'):
                 correction_result = self.correction_backend([(correction_prompt, True)])
-                extraction_prompt = self._build_transcription_formatting_prompt(
-                    transcription_output=correction_result,
-                    n_clips=len(clips_data),
-                    target_language=target_language
-                )
+            extraction_prompt = self._build_transcription_formatting_prompt(
+                transcription_output=correction_result,
+                n_clips=len(clips_data),
+                target_language=target_language
+            )
+            with llm_stage('extraction'):
                 extraction_result = self.extraction_backend([(extraction_prompt, True)])
 
+            try:
                 transcriptions: Dict[str, str] = json.loads(extraction_result)
-                assert set(range(len(clips_data))).issuperset(int(key) for key in transcriptions.keys()), "Invalid clip indices detected in formatted transcriptions!"
                 assert isinstance(transcriptions, Dict), "Unexpected JSON structure from extraction output!"
+                assert set(range(len(clips_data))).issuperset(int(key) for key in transcriptions.keys()), "Invalid clip indices detected in formatted transcriptions!"
                 assert all(isinstance(val, str) for val in transcriptions.values()), "Unexpected JSON structure from extraction output!"
+            except (ValueError, AssertionError) as e:
+                raise ResponseParseError(f'Failed to parse the extracted transcriptions: {e}') from e
 
-                return [transcriptions.get(str(i), '') for i in range(len(clips_data))]
-                
-            except Exception as e:
-                continue
-        
-        raise Exception(f'Max retry count of {self.max_retry_count} reached!')
+            return [transcriptions.get(str(i), '') for i in range(len(clips_data))]
+
+        return self.retry_policy.call(attempt, retry_on=(ErrorKinds.PARSE_FAILURE,))
 
     def _build_transcription_correction_prompt(
         self,
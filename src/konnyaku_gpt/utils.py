@@ -1,13 +1,20 @@
 import logging
 import numpy as np
-from typing import Iterable, List, Collection, Dict, Any, Callable, Tuple
+from typing import Iterable, List, Collection, Dict, Any, Callable, Tuple, Sequence, Deque
 from pathlib import Path
 from tqdm import tqdm
 import os
 import imageio
 from PIL import Image
 import json
-import shutil
+import subprocess
+import csv
+import re
+import imageio_ffmpeg
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future
+import threading
+import tempfile
 
 import proglog
 proglog.default_bar_logger = lambda *args, **kwargs: proglog.MuteProgressBarLogger()
@@ -15,116 +22,707 @@ proglog.default_bar_logger = lambda *args, **kwargs: proglog.MuteProgressBarLogg
 from moviepy.video.io.VideoFileClip import VideoFileClip, AudioFileClip
 
 from .data_models import ClipMetaData, ClipSetMetadata
+from .frame_difference import FrameDifferenceEngine, DownscaledGrayDifferenceEngine
+from .frame_reader import FfmpegFrameReader
+from .audio import PcmAudioTrack, extract_audio_track, detect_silent_clips
 from .models.image_to_text import ImageToTextModelService
 from .models.transcriber import TranscriberModelService
+from .models.cached import CachedTranscriberModelService, CachedImageToTextModelService
+from .cache import ContentCache
+from .perceptual_hash import dhash, is_flat, group_near_duplicates
 
-TMP_AUDIO_PATH = 'tmp.mp3'
+# maximum distance (in seconds) between a clip start reported by ffmpeg and a detected cut for them to be considered the same
+SEGMENT_SNAP_TOLERANCE = 0.25
+# number of frames between two checkpoints of the cut detection pass
+DIFFERENCES_CHECKPOINT_INTERVAL = 1000
+# in strided cut detection, windows whose coarse difference exceeds this fraction of rtol are searched for cuts,
+# so that cuts whose difference is spread over several frames of a window are unlikely (but not guaranteed) to be missed
+STRIDED_REFINE_MARGIN = 0.5
+# the directory (in the clips directory) which the representative frames of the clips are saved to
+REPRESENTATIVE_FRAMES_DIR = 'frames'
 
 
-def split_video(video_path: Path, output_dir: Path, rtol: float=0.2):
+class SplitModes:
+    """Ways of producing the clip files in `split_video`."""
+
+    # encode each clip while decoding the video, then re-encode it again to attach the audio
+    REENCODE = 'reencode'
+    # analysis-only pass, then cut all clips with a single ffmpeg stream-copy pass (no encoding);
+    # cuts are moved to the next keyframe if they do not land on one
+    STREAM_COPY = 'stream-copy'
+    # analysis-only pass, then a single ffmpeg encoding pass with keyframes forced at the cuts
+    SEGMENT = 'segment'
+    # analysis-only pass; no clip files are produced and clips are read directly from the source video
+    VIRTUAL = 'virtual'
+
+
+def split_video(video_path: Path, output_dir: Path, rtol: float=0.2, detection_engine: FrameDifferenceEngine | None=None,
+                mode: str=SplitModes.REENCODE, encoding_workers: int | None=None, frame_differences_path: Path | None=None,
+                resume: bool=False, detection_stride: int=1):
     """Splits a video into continuous clips by relative difference between consecutive frames.
     
     The relative difference between two frames, `A`, `B` is calculated as
     `|A - B| / (|A| + |B|)`, which is always between 0 and 1 for real matrices.
+    
+    The first frame of each clip is saved into `output_dir / REPRESENTATIVE_FRAMES_DIR`
+    and listed in the `representative_frames` of its metadata.
 
     Args:
-        video (th.Tensor): The video. Shape should be (frame_index, channel, height, width).
+        video_path (Path): The path to the video.
+        output_dir (Path): The directory to save the clips and their metadata to. Must not exist unless `resume` is True.
         rtol (float, optional): The maximum relative difference in a clip.
             When two consecutive frames have a relative difference larger than rtol,
             they are considered the end frame of one clip and the start frame of another.
-            Defaults to 0.1.
+            Defaults to 0.2.
+        detection_engine (FrameDifferenceEngine | None, optional): The engine used to compute frame differences.
+            "None" means comparing downscaled grayscale frames (`DownscaledGrayDifferenceEngine`).
+            Use `FullFrameDifferenceEngine` to compare full-resolution frames instead. Defaults to None.
+        mode (str, optional): How the clip files are produced. One of the values in `SplitModes`.
+            In "stream-copy" mode, the clip ranges in the metadata are the actual ranges of the clip files,
+            which may differ from the detected cuts when a cut does not land on a keyframe.
+            In "virtual" mode, only the metadata is written and it refers to `video_path`.
+            Defaults to "reencode".
+        encoding_workers (int | None, optional): "reencode" mode only. The number of worker processes which encode the clips
+            while the video is being decoded. At most this number of clips are waiting to be encoded at any time.
+            "None" means encoding each clip in the current process before decoding further. Defaults to None.
+        frame_differences_path (Path | None, optional): Where the frame differences of the video are saved (see `save_frame_differences`).
+            If the file exists, the saved frame differences are used and no cut detection is performed;
+            otherwise, the frame differences computed when splitting are saved to it.
+            "None" means not saving the frame differences. Defaults to None.
+        resume (bool, optional): Whether to resume an interrupted split whose progress was checkpointed in `output_dir`.
+            Splitting restarts from the last completed clip (or the last checkpointed frame in the cut detection pass)
+            instead of the first frame. Other arguments must be the same as those of the interrupted split. Defaults to False.
+        detection_stride (int, optional): Compare only every `detection_stride`-th frame, and search the windows
+            whose difference is large for the exact cut frames (see `compute_frame_differences`).
+            The cuts usually match those of comparing all frames, but this is a heuristic (see `STRIDED_REFINE_MARGIN`), not a guarantee.
+            It only saves comparisons (all frames are still decoded), so it only speeds up engines that are expensive per frame.
+            Cut detection is then done before splitting in all modes, and its progress is not checkpointed. Defaults to 1.
     """
     
-    assert not output_dir.exists(), "Output directory already exists!"
+    assert resume or not output_dir.exists(), "Output directory already exists!"
     assert rtol >= 0 and rtol <= 1, "rtol must be between 0 and 1!"
     
-    def norm(x: np.ndarray):
-        return np.sqrt((x ** 2).sum())
+    if (output_dir / 'metadata.json').exists():
+        logging.info(f'{output_dir} already contains a split video.')
+        return
+    
+    output_dir.mkdir(exist_ok=True)
+    checkpoint = _SplitCheckpoint(output_dir)
+    
+    if detection_engine is None:
+        detection_engine = DownscaledGrayDifferenceEngine()
+
+    detection_engine.reset()
+
+    differences, fps = None, None
+    should_save_differences = frame_differences_path is not None
+    if frame_differences_path is not None and frame_differences_path.exists():
+        try:
+            differences, fps = load_frame_differences(frame_differences_path, rtol)
+            logging.info(f'Using the frame differences saved in {frame_differences_path}.')
+            should_save_differences = False
+        except Exception as e:
+            logging.warning(f'Not using the frame differences saved in {frame_differences_path} ({e}); computing them again.')
+
+    # strided differences are only valid for `rtol` values not smaller than this one
+    refine_rtol = rtol * STRIDED_REFINE_MARGIN if detection_stride > 1 else None
+
+    if differences is None and (mode != SplitModes.REENCODE or detection_stride > 1):
+        if detection_stride > 1:
+            differences, fps = compute_frame_differences(video_path, detection_engine, stride=detection_stride,
+                                                         refine_rtol=refine_rtol)
+        else:
+            differences, fps = compute_frame_differences(video_path, detection_engine, checkpoint_path=checkpoint.differences_path)
+
+    match mode:
+        case SplitModes.REENCODE:
+            differences, fps = _split_video_reencode(video_path, output_dir, rtol, detection_engine, encoding_workers, differences, checkpoint)
+        case SplitModes.STREAM_COPY | SplitModes.SEGMENT:
+            clip_ranges = clip_ranges_from_frame_differences(differences, fps, rtol)
+
+            clips_metadata = _cut_clips_with_ffmpeg(video_path, output_dir, clip_ranges, fps, stream_copy=mode == SplitModes.STREAM_COPY)
+            _extract_representative_frames(video_path, output_dir, clips_metadata, fps)
+
+            with open(output_dir / 'metadata.json', 'x') as f:
+                f.write(ClipSetMetadata(clips_metadata).to_json())
+        case SplitModes.VIRTUAL:
+            clip_ranges = clip_ranges_from_frame_differences(differences, fps, rtol)
+            clips_metadata = [ClipMetaData(index=i, path=None, clip_range=clip_range) for i, clip_range in enumerate(clip_ranges)]
+            _extract_representative_frames(video_path, output_dir, clips_metadata, fps)
+
+            with open(output_dir / 'metadata.json', 'x') as f:
+                f.write(ClipSetMetadata(clips_metadata, source_video_path=video_path.absolute().resolve()).to_json())
+        case _:
+            raise Exception(f'Unknown split mode: {mode}')
+
+    if should_save_differences:
+        save_frame_differences(frame_differences_path, differences, fps, refine_rtol=refine_rtol)
+
+    checkpoint.remove()
+
+class _SplitCheckpoint:
+    """Progress of an unfinished split, saved in its output directory.
+    
+    It consists of the metadata of the clips that have been completely written (one JSON object per line)
+    and the frame differences computed so far (raw float32).
+    Both files are only appended to, so that an interruption at any point leaves them readable.
+    """
+
+    def __init__(self, output_dir: Path):
+        self.output_dir = output_dir
+        self.clips_path = output_dir / 'checkpoint_clips.jsonl'
+        self.differences_path = output_dir / 'checkpoint_differences.f32'
+
+    def load_clips(self) -> List[ClipMetaData]:
+        clips_metadata = []
+
+        if self.clips_path.exists():
+            with open(self.clips_path, 'r') as f:
+                for line in f:
+                    try:
+                        clips_metadata.append(ClipMetaData.from_json(line))
+                    except Exception:
+                        # the last line may have been partially written
+                        break
+
+        return clips_metadata
 
-    def calc_frame_difference(frame1, frame2):
-        return norm(frame1 - frame2) / (norm(frame1) + norm(frame2))
+    def append_clip(self, clip_metadata: ClipMetaData) -> None:
+        with open(self.clips_path, 'a') as f:
+            f.write(json.dumps(clip_metadata.as_pytree()) + '\n')
 
-    video_reader = imageio.get_reader(video_path)
-    metadata = video_reader.get_meta_data()
-    video_clip = VideoFileClip(str(video_path))
-    audio_clip = video_clip.audio
-    fps, codec = video_clip.fps, metadata['codec']
+    def remove(self) -> None:
+        for path in (self.clips_path, self.differences_path):
+            if path.exists():
+                os.remove(path)
+
+def _read_float32_file(path: Path) -> np.ndarray:
+    if not path.exists():
+        return np.zeros(0, dtype=np.float32)
+
+    data = path.read_bytes()
+    # a partially written trailing value is dropped
+    return np.frombuffer(data[:len(data) - len(data) % 4], dtype=np.float32)
+
+def _append_float32_file(path: Path, values: Sequence[float]) -> None:
+    with open(path, 'ab') as f:
+        f.write(np.asarray(values, dtype=np.float32).tobytes())
+
+def _truncate_float32_file(path: Path, length: int) -> None:
+    with open(path, 'ab') as f:
+        f.truncate(length * 4)
+
+def _split_video_reencode(video_path: Path, output_dir: Path, rtol: float, detection_engine: FrameDifferenceEngine,
+                          encoding_workers: int | None, known_differences: np.ndarray | None,
+                          checkpoint: _SplitCheckpoint) -> Tuple[np.ndarray, float]:
+    """Splits a video in "reencode" mode, resuming from the last completed clip in `checkpoint` (if any).
     
-    last_frame = next(iter(video_reader))
+    If `known_differences` is not None, it is used instead of `detection_engine`.
+    
+    Returns:
+        Tuple[np.ndarray, float]: The frame differences and the frame rate of the video.
+    """
 
-    clip_index = 0
     def get_tmp_path(number):
         return Path(output_dir / f"{number}_tmp.mp4")
     
     def get_output_path(number):
         return Path(output_dir / f"{number}.mp4")
-    
-    if not output_dir.is_dir():
-        output_dir.mkdir()
-        
-    current_writer = imageio.get_writer(get_tmp_path(clip_index + 1), fps=fps, codec=codec, macro_block_size=1)
 
-    def format_save_message(number, path):
-        return f"Saved clip {number} to {path}."
-    
-    n_frames = metadata['duration'] * metadata['fps']
+    def save_representative_frame(number, frame):
+        frame_path = Path(REPRESENTATIVE_FRAMES_DIR) / f'{number}.jpg'
+        Image.fromarray(frame).save(output_dir / frame_path, quality=95)
+        return frame_path
 
-    start_time = 0.5 / fps
-    
-    clips_metadata: List[ClipMetaData] = []
+    # full-resolution frames are needed for writing the clips; the frame rate comes from the same reader
+    video_reader = FfmpegFrameReader(video_path)
+    fps = video_reader.fps
+    codec = video_reader.codec
+
+    # restore progress
+    clips_metadata: List[ClipMetaData] = checkpoint.load_clips()
+    differences: List[float] = list(_read_float32_file(checkpoint.differences_path))
+
+    if len(clips_metadata) > 0:
+        start_time = clips_metadata[-1].clip_range[1]
+        # index of the first frame of the next clip
+        start_frame = round(start_time * fps - 0.5)
+
+        if len(differences) <= start_frame:
+            logging.warning('Frame differences are missing from the split checkpoint; splitting from the beginning.')
+            clips_metadata, start_frame = [], 0
+    else:
+        start_frame = 0
+
+    if start_frame == 0:
+        start_time = 0.5 / fps
+        differences = []
+        checkpoint.remove()
+    else:
+        logging.info(f'Resuming splitting from clip {len(clips_metadata) + 1} (frame {start_frame}).')
+        differences = differences[:start_frame + 1]
+        _truncate_float32_file(checkpoint.differences_path, len(differences))
+
+    n_checkpointed_differences = len(differences)
+    clip_index = len(clips_metadata)
+
+    # remove clips that were being written when the split was interrupted
+    for path in output_dir.glob('*.mp4'):
+        if path.stem.endswith('_tmp') or int(path.stem) > clip_index:
+            os.remove(path)
+
+    (output_dir / REPRESENTATIVE_FRAMES_DIR).mkdir(exist_ok=True)
+
+    video_reader.start_frame = start_frame
+
+    # cuts are detected on the same (scaled) frames as in the analysis pass of the other modes (see `compute_frame_differences`),
+    # so that all modes find the same cuts; the scaled frames are made by the same ffmpeg process as the full-resolution ones
+    if known_differences is None and (detection_engine.decode_width is not None or detection_engine.decode_gray):
+        frame_pairs = video_reader.iter_with_scaled(detection_engine.decode_width, detection_engine.decode_gray)
+    else:
+        frame_pairs = ((frame, frame) for frame in video_reader)
+
+    current_writer = None
+    audio_clip = None
+    executor = None
+
+    pending_encodings: Deque[Tuple[Future, ClipMetaData]] = deque()
+
+    def wait_for_oldest_encoding():
+        future, clip_metadata = pending_encodings.popleft()
+        future.result()
+        checkpoint.append_clip(clip_metadata)
+
+    def finalize_clip(clip_metadata: ClipMetaData):
+        nonlocal n_checkpointed_differences
+
+        # differences up to the end of the clip must be checkpointed before the clip itself
+        _append_float32_file(checkpoint.differences_path, differences[n_checkpointed_differences:])
+        n_checkpointed_differences = len(differences)
+
+        number = clip_metadata.index + 1
+
+        if executor is None:
+            _finalize_reencoded_clip(audio_clip, get_tmp_path(number), get_output_path(number), clip_metadata.clip_range)
+            checkpoint.append_clip(clip_metadata)
+        else:
+            # bound the number of clips waiting to be encoded (each of them holds a temporary file)
+            if len(pending_encodings) >= encoding_workers:
+                wait_for_oldest_encoding()
+
+            future = executor.submit(_finalize_reencoded_clip_in_worker, get_tmp_path(number), get_output_path(number), clip_metadata.clip_range)
+            pending_encodings.append((future, clip_metadata))
     
-    progress = tqdm(video_reader, total=n_frames)
-    for frame_idx, frame in enumerate(progress):
-        progress.set_description(f'clip {clip_index + 1}')
+    n_frames = video_reader.n_frames
 
-        diff = calc_frame_difference(last_frame, frame)
-        
-        assert 0 <= diff < 1
-        
-        if diff > rtol:
-            end_time = (frame_idx + 0.5) / fps
-            
-            current_writer.close()
-            current_clip = VideoFileClip(str(get_tmp_path(clip_index + 1)))
-            current_clip.audio = audio_clip.subclip(start_time, end_time)
-            current_clip.write_videofile(str(get_output_path(clip_index + 1)))
-            clips_metadata.append(ClipMetaData(
-                index=clip_index,
-                path=get_output_path(clip_index + 1).name,
-                clip_range=(start_time, end_time)
-            ))
-            os.remove(get_tmp_path(clip_index + 1))
-            
-            clip_index += 1
-            
-            current_writer = imageio.get_writer(get_tmp_path(clip_index + 1), fps=fps, codec=codec, macro_block_size=1)
-            current_writer.append_data(frame)
+    # the ffmpeg processes and the encoding workers must not outlive an error
+    succeeded = False
+    try:
+        current_writer = imageio.get_writer(get_tmp_path(clip_index + 1), fps=fps, codec=codec, macro_block_size=1)
+
+        # attaching audio re-encodes the clip, so it is done in worker processes (if any) while decoding goes on
+        if encoding_workers is None:
+            audio_clip = AudioFileClip(str(video_path))
+        else:
+            executor = ProcessPoolExecutor(max_workers=encoding_workers, initializer=_init_reencode_worker, initargs=(video_path,))
+
+        progress = tqdm(frame_pairs, total=n_frames, initial=start_frame)
+        for frame_idx, (frame, detection_frame) in enumerate(progress, start=start_frame):
+            progress.set_description(f'clip {clip_index + 1}')
+
+            if frame_idx == start_frame:
+                representative_frame_path = save_representative_frame(clip_index + 1, frame)
+
+            if frame_idx == start_frame and start_frame > 0:
+                # first frame of the clip to resume from; its difference from the previous frame is known
+                if known_differences is None:
+                    detection_engine.push(detection_frame)
+
+                current_writer.append_data(frame)
+                continue
+
+            if known_differences is None:
+                diff = detection_engine.push(detection_frame)
+            else:
+                diff = float(known_differences[frame_idx]) if frame_idx < len(known_differences) else 0.0
+
+            differences.append(diff)
             
-            start_time = end_time
+            # differences of frames skipped by strided detection are NaN
+            assert np.isnan(diff) or 0 <= diff <= 1
             
-        else:
-            current_writer.append_data(frame)
+            if diff > rtol:
+                end_time = (frame_idx + 0.5) / fps
+                
+                current_writer.close()
+                clips_metadata.append(ClipMetaData(
+                    index=clip_index,
+                    path=get_output_path(clip_index + 1).name,
+                    clip_range=(start_time, end_time),
+                    representative_frames=[representative_frame_path]
+                ))
+                finalize_clip(clips_metadata[-1])
+                
+                clip_index += 1
+                
+                current_writer = imageio.get_writer(get_tmp_path(clip_index + 1), fps=fps, codec=codec, macro_block_size=1)
+                current_writer.append_data(frame)
+                representative_frame_path = save_representative_frame(clip_index + 1, frame)
+                
+                start_time = end_time
+                
+            else:
+                current_writer.append_data(frame)
         
-        last_frame = frame
-    
-    end_time = (frame_idx + 0.5) / fps
-    
-    current_writer.close()
-    current_clip = VideoFileClip(str(get_tmp_path(clip_index + 1)))
-    current_clip.audio = audio_clip.subclip(start_time, end_time)
-    current_clip.write_videofile(str(get_output_path(clip_index + 1)))
-    clips_metadata.append(ClipMetaData(
-        index=clip_index,
-        path=get_output_path(clip_index + 1).name,
-        clip_range=(start_time, end_time)
-    ))
-    os.remove(get_tmp_path(clip_index + 1))
+        end_time = (frame_idx + 0.5) / fps
+        
+        current_writer.close()
+        clips_metadata.append(ClipMetaData(
+            index=clip_index,
+            path=get_output_path(clip_index + 1).name,
+            clip_range=(start_time, end_time),
+            representative_frames=[representative_frame_path]
+        ))
+        finalize_clip(clips_metadata[-1])
+
+        while len(pending_encodings) > 0:
+            wait_for_oldest_encoding()
 
-    video_reader.close()
+        succeeded = True
+    finally:
+        video_reader.close()
+
+        if current_writer is not None:
+            current_writer.close()
+
+        if executor is not None:
+            # on error, clips that have not started encoding are dropped; they are redone when resuming
+            executor.shutdown(cancel_futures=not succeeded)
+
+        if audio_clip is not None:
+            audio_clip.close()
     
     with open(output_dir / 'metadata.json', 'x') as f:
         f.write(ClipSetMetadata(clips_metadata).to_json())
 
+    return np.array(differences, dtype=np.float32), fps
+
+def _finalize_reencoded_clip(audio_clip: AudioFileClip, tmp_path: Path, output_path: Path, clip_range: Tuple[float, float]):
+    """Attaches audio to a clip encoded without audio and saves it to `output_path`."""
+
+    clip = VideoFileClip(str(tmp_path), audio=False)
+    clip.audio = audio_clip.subclip(*clip_range)
+    clip.write_videofile(str(output_path))
+
+    # the subclip shares its reader with `audio_clip`, so it must not be closed
+    clip.audio = None
+    clip.close()
+
+    os.remove(tmp_path)
+
+# audio track of the video being split, opened once in each clip encoding worker process
+_reencode_worker_audio_clip: AudioFileClip | None = None
+
+def _init_reencode_worker(video_path: Path):
+    global _reencode_worker_audio_clip
+    _reencode_worker_audio_clip = AudioFileClip(str(video_path))
+
+def _finalize_reencoded_clip_in_worker(tmp_path: Path, output_path: Path, clip_range: Tuple[float, float]):
+    _finalize_reencoded_clip(_reencode_worker_audio_clip, tmp_path, output_path, clip_range)
+
+def compute_frame_differences(video_path: Path, detection_engine: FrameDifferenceEngine, checkpoint_path: Path | None=None,
+                              stride: int=1, refine_rtol: float | None=None) -> Tuple[np.ndarray, float]:
+    """Decodes a video and computes the relative difference between each frame and its previous frame.
+    
+    Frames are decoded at the size and in the format requested by the engine.
+
+    With a `stride` larger than 1, only every `stride`-th frame is compared with the previous compared frame.
+    The frames of each window between two compared frames are kept while decoding, and if the difference of the window
+    exceeds `refine_rtol`, they are compared one by one, so the difference of every cut frame in such windows is exact.
+    The frames in the other windows get a difference of NaN (i.e. they are never cuts).
+    Finding the same cuts as comparing all frames is NOT guaranteed: it relies on `refine_rtol` being no larger than
+    the difference between the first and the last frame of any window containing a cut, which `split_video` only makes likely
+    by using a fraction (`STRIDED_REFINE_MARGIN`) of `rtol`; e.g., a cut away and back within one window is missed.
+    All frames are still decoded in a single pass, so striding only saves comparisons;
+    it pays off with engines that are expensive per frame (e.g., `FullFrameDifferenceEngine`), while the cost of
+    engines working on small frames is dominated by decoding.
+
+    Args:
+        video_path (Path): The path to the video.
+        detection_engine (FrameDifferenceEngine): The engine used to compute frame differences.
+        checkpoint_path (Path | None, optional): A file which the differences are periodically appended to (as raw float32).
+            If it already contains differences, computation resumes from the last of them instead of the first frame.
+            "None" means no checkpointing. Not supported with a `stride` larger than 1. Defaults to None.
+        stride (int, optional): The number of frames between two frames compared in the first pass. Defaults to 1.
+        refine_rtol (float | None, optional): The minimum difference of a window to search it for cuts.
+            Must be given if `stride` is larger than 1. Defaults to None.
+
+    Returns:
+        Tuple[np.ndarray, float]: The frame differences and the frame rate of the video.
+            The i-th element of the differences is the relative difference between frame i - 1 and frame i
+            (0 for the first frame).
+    """
+
+    if stride > 1:
+        assert checkpoint_path is None, "Checkpointing is not supported in strided cut detection!"
+        assert refine_rtol is not None, "refine_rtol must be given in strided cut detection!"
+        return _compute_frame_differences_strided(video_path, detection_engine, stride, refine_rtol)
+
+    detection_engine.reset()
+
+    differences = list(_read_float32_file(checkpoint_path)) if checkpoint_path is not None else []
+    # the last checkpointed frame is decoded again so that the next frame can be compared with it
+    start_frame = max(len(differences) - 1, 0)
+
+    if start_frame == 0:
+        differences = []
+
+        if checkpoint_path is not None:
+            _truncate_float32_file(checkpoint_path, 0)
+    else:
+        logging.info(f'Resuming cut detection from frame {start_frame}.')
+
+    n_checkpointed = len(differences)
+
+    with FfmpegFrameReader(video_path, width=detection_engine.decode_width, gray=detection_engine.decode_gray, start_frame=start_frame) as video_reader:
+        progress = tqdm(video_reader, total=video_reader.n_frames, initial=start_frame, desc='detecting cuts')
+
+        for frame_idx, frame in enumerate(progress, start=start_frame):
+            diff = detection_engine.push(frame)
+
+            if frame_idx == start_frame and start_frame > 0:
+                continue
+
+            differences.append(diff)
+
+            if checkpoint_path is not None and len(differences) - n_checkpointed >= DIFFERENCES_CHECKPOINT_INTERVAL:
+                _append_float32_file(checkpoint_path, differences[n_checkpointed:])
+                n_checkpointed = len(differences)
+
+    return np.array(differences, dtype=np.float32), video_reader.fps
+
+def _compute_frame_differences_strided(video_path: Path, detection_engine: FrameDifferenceEngine,
+                                       stride: int, refine_rtol: float) -> Tuple[np.ndarray, float]:
+    detection_engine.reset()
+    differences: List[float] = []
+
+    # the frames decoded since the last compared frame, so that their window can be refined without decoding it again
+    window: np.ndarray | None = None
+    n_window_frames = 0
+
+    def refine(last_compared_state: Tuple[np.ndarray | None, float]) -> None:
+        """Compares the frames in `window` one by one, starting from the last compared frame."""
+
+        detection_engine.restore_state(last_compared_state)
+        differences.extend(detection_engine.push(window[k]) for k in range(n_window_frames))
+
+    with FfmpegFrameReader(video_path, width=detection_engine.decode_width, gray=detection_engine.decode_gray) as video_reader:
+        fps = video_reader.fps
+
+        for frame_idx, frame in enumerate(tqdm(video_reader, total=video_reader.n_frames, desc='detecting cuts (strided)')):
+            if frame_idx == 0:
+                differences.append(detection_engine.push(frame))
+                last_compared_state = detection_engine.save_state()
+                window = np.empty((stride, *frame.shape), dtype=frame.dtype)
+                continue
+
+            window[n_window_frames] = frame
+            n_window_frames += 1
+
+            if n_window_frames == stride:
+                if detection_engine.push(frame) > refine_rtol:
+                    # also leaves the engine holding this frame
+                    refine(last_compared_state)
+                else:
+                    differences.extend([np.nan] * stride)
+
+                last_compared_state = detection_engine.save_state()
+                n_window_frames = 0
+
+        # the frames after the last compared frame (if any)
+        if n_window_frames > 0:
+            refine(last_compared_state)
+
+    return np.array(differences, dtype=np.float32), fps
+
+def clip_ranges_from_frame_differences(differences: np.ndarray, fps: float, rtol: float) -> List[Tuple[float, float]]:
+    """Computes the time ranges of the clips from the frame differences of a video.
+
+    The ranges are the same as the ones computed by `split_video` in "reencode" mode.
+    Frames whose difference is NaN (i.e. skipped by strided cut detection) are never cuts.
+
+    Args:
+        differences (np.ndarray): The frame differences, as returned by `compute_frame_differences`.
+        fps (float): The frame rate of the video.
+        rtol (float): The maximum relative difference in a clip.
+
+    Returns:
+        List[Tuple[float, float]]: The time ranges of the clips, in seconds.
+    """
+
+    cut_frames = np.flatnonzero(differences > rtol)
+    boundaries = np.concatenate([[0], cut_frames, [len(differences) - 1]]) + 0.5
+
+    return [(float(start / fps), float(end / fps)) for start, end in zip(boundaries[:-1], boundaries[1:])]
+
+def save_frame_differences(path: Path, differences: np.ndarray, fps: float, refine_rtol: float | None=None) -> None:
+    """Saves the frame differences of a video, so that it can be re-split with other `rtol` values without decoding it again.
+
+    Args:
+        path (Path): The output file path (.npz).
+        differences (np.ndarray): The frame differences, as returned by `compute_frame_differences`.
+        fps (float): The frame rate of the video.
+        refine_rtol (float | None, optional): The `refine_rtol` of strided cut detection, if the differences were computed with it.
+            Cuts are only searched for in the windows whose difference exceeds it, so the differences are only loaded
+            for `rtol` values of at least `refine_rtol / STRIDED_REFINE_MARGIN`. "None" means all frames were compared. Defaults to None.
+    """
+
+    with open(path, 'wb') as f:
+        np.savez_compressed(f, differences=differences.astype(np.float32), fps=np.float64(fps),
+                            refine_rtol=np.float64(refine_rtol if refine_rtol is not None else np.nan))
+
+def load_frame_differences(path: Path, rtol: float | None=None) -> Tuple[np.ndarray, float]:
+    """Loads the frame differences saved by `save_frame_differences`.
+
+    Args:
+        path (Path): The file saved by `save_frame_differences`.
+        rtol (float | None, optional): The `rtol` that the differences will be used with.
+            An exception is raised if the differences come from strided cut detection which may have missed the cuts for this `rtol`.
+            "None" means no check. Defaults to None.
+
+    Returns:
+        Tuple[np.ndarray, float]: The frame differences and the frame rate of the video.
+    """
+
+    with np.load(path) as data:
+        differences, fps = data['differences'], float(data['fps'])
+        # files saved before strided detection have no `refine_rtol`
+        refine_rtol = float(data['refine_rtol']) if 'refine_rtol' in data.files else np.nan
+
+    if rtol is not None and not np.isnan(refine_rtol) and rtol < refine_rtol / STRIDED_REFINE_MARGIN:
+        raise Exception(f'The frame differences in {path} come from strided cut detection '
+                        f'and are only valid for rtol >= {refine_rtol / STRIDED_REFINE_MARGIN}, but got rtol={rtol}!')
+
+    return differences, fps
+
+def sweep_split_rtol(frame_differences_path: Path, rtols: Iterable[float]) -> Dict[float, List[Tuple[float, float]]]:
+    """Computes the clip ranges that a video would be split into with each of several `rtol` values, without decoding the video.
+
+    Args:
+        frame_differences_path (Path): The frame differences of the video, saved by `save_frame_differences`.
+        rtols (Iterable[float]): The `rtol` values to try. If the differences come from strided cut detection,
+            they must not be smaller than the `rtol` of that split.
+
+    Returns:
+        Dict[float, List[Tuple[float, float]]]: The clip ranges for each `rtol`.
+    """
+
+    rtols = list(rtols)
+    # validates the smallest rtol against strided differences
+    differences, fps = load_frame_differences(frame_differences_path, min(rtols, default=None))
+
+    return {rtol: clip_ranges_from_frame_differences(differences, fps, rtol) for rtol in rtols}
+
+def _run_ffmpeg(args: List[str]) -> None:
+    subprocess.run([imageio_ffmpeg.get_ffmpeg_exe(), '-nostdin', '-loglevel', 'error', '-y', *args],
+                   check=True, stdout=subprocess.DEVNULL)
+
+def _keyframe_times(video_path: Path) -> np.ndarray:
+    """Gets the presentation times (in seconds) of the keyframes of a video, decoding only the keyframes."""
+
+    result = subprocess.run([imageio_ffmpeg.get_ffmpeg_exe(), '-nostdin', '-skip_frame', 'nokey', '-i', str(video_path),
+                             '-map', '0:v:0', '-vf', 'showinfo', '-vsync', 'passthrough', '-f', 'null', '-'],
+                            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+    return np.array([float(time) for time in re.findall(r'pts_time:\s*(-?[\d.]+)', result.stderr)])
+
+def _cut_clips_with_ffmpeg(video_path: Path, output_dir: Path, clip_ranges: Sequence[Tuple[float, float]], fps: float,
+                           stream_copy: bool) -> List[ClipMetaData]:
+    """Cuts a video into clips with a single ffmpeg pass of the segment muxer.
+
+    Args:
+        video_path (Path): The path to the video.
+        output_dir (Path): The directory to save the clips to.
+        clip_ranges (Sequence[Tuple[float, float]]): The clip ranges, as returned by `clip_ranges_from_frame_differences`.
+        fps (float): The frame rate of the video.
+        stream_copy (bool): Whether to copy the streams without encoding.
+            If True, a cut is moved to the next keyframe if it does not land on one, and the clip starts at that keyframe.
+            Otherwise, the video is encoded once with keyframes forced at the cuts.
+
+    Returns:
+        List[ClipMetaData]: Metadata of the clips.
+    """
+
+    # a range ends at (index of the first frame of the next clip + 0.5) / fps,
+    # while ffmpeg cuts at the first frame whose timestamp is no less than the cut time
+    cut_times = ','.join(f'{end - 1 / fps:.6f}' for _, end in clip_ranges[:-1])
+    segment_list_path = output_dir / 'segments.csv'
+
+    codec_args = ['-c', 'copy'] if stream_copy else ['-c:v', 'libx264', '-c:a', 'aac', '-force_key_frames', cut_times]
+    segment_args = ['-segment_times', cut_times] if cut_times else []
+
+    _run_ffmpeg(['-i', str(video_path), '-map', '0:v:0', '-map', '0:a:0?', *codec_args,
+                 '-f', 'segment', *segment_args, '-reset_timestamps', '1', '-segment_start_number', '1',
+                 '-segment_list', str(segment_list_path), '-segment_list_type', 'csv',
+                 str(output_dir / '%d.mp4')])
+
+    with open(segment_list_path, 'r') as f:
+        segments = [(filename, float(start), float(end)) for filename, start, end in csv.reader(f)]
+
+    os.remove(segment_list_path)
+
+    if len(segments) != len(clip_ranges):
+        logging.info(f'{len(clip_ranges) - len(segments)} cuts do not land on keyframes and were merged into other clips.')
+
+    # the segment start times reported by ffmpeg include codec delays (e.g., of B-frames)
+    starts = []
+    if stream_copy:
+        # a segment starts with the latest keyframe at or before its reported start;
+        # like the detected cuts, a clip starting with frame k starts at (k + 0.5) / fps
+        keyframe_times = _keyframe_times(video_path)
+        for _, start, _ in segments:
+            keyframe_index = max(0, int(np.searchsorted(keyframe_times, start + 0.5 / fps, side='right')) - 1)
+            frame_index = round((keyframe_times[keyframe_index] - keyframe_times[0]) * fps)
+            starts.append((frame_index + 0.5) / fps)
+    else:
+        # keyframes are forced at the detected cuts, so the segments start at them
+        detected_starts = np.array([start for start, _ in clip_ranges])
+        for _, start, _ in segments:
+            nearest = detected_starts[np.argmin(np.abs(detected_starts - start))]
+            starts.append(float(nearest) if abs(nearest - start) < SEGMENT_SNAP_TOLERANCE else start)
+
+    ends = starts[1:] + [clip_ranges[-1][1]]
+
+    return [ClipMetaData(index=i, path=Path(filename), clip_range=(start, end))
+            for i, ((filename, _, _), start, end) in enumerate(zip(segments, starts, ends))]
+
+def _extract_representative_frames(video_path: Path, output_dir: Path, clips_metadata: List[ClipMetaData], fps: float) -> None:
+    """Saves the first frame of each clip into `output_dir / REPRESENTATIVE_FRAMES_DIR` with a single ffmpeg pass,
+    and records them in `clips_metadata` (in place).
+    """
+
+    frames_dir = output_dir / REPRESENTATIVE_FRAMES_DIR
+    frames_dir.mkdir(exist_ok=True)
+
+    # a clip starting at (k + 0.5) / fps starts with frame k;
+    # the indices must be increasing for the n-th extracted image to belong to the n-th clip
+    frame_indices = []
+    for clip_metadata in clips_metadata:
+        frame_index = max(0, round(clip_metadata.clip_range[0] * fps - 0.5))
+        frame_indices.append(max(frame_index, frame_indices[-1] + 1) if len(frame_indices) > 0 else frame_index)
+
+    select = '+'.join(f'eq(n\\,{frame_index})' for frame_index in frame_indices)
+    _run_ffmpeg(['-i', str(video_path), '-map', '0:v:0', '-vf', f'select={select}', '-vsync', 'passthrough',
+                 '-q:v', '2', '-start_number', '1', str(frames_dir / '%d.jpg')])
+
+    for number, clip_metadata in enumerate(clips_metadata, start=1):
+        frame_path = Path(REPRESENTATIVE_FRAMES_DIR) / f'{number}.jpg'
+
+        if (output_dir / frame_path).exists():
+            clip_metadata.representative_frames = [frame_path]
+        else:
+            logging.warning(f'Failed to extract the representative frame of clip {number}.')
+
 def get_arbitrary_image(video_path: Path) -> Image.Image:
     """Gets an arbitrary image from a video clip.
     
@@ -142,7 +740,64 @@ def get_arbitrary_image(video_path: Path) -> Image.Image:
 
     return Image.fromarray(frame)
 
-def transcribe_clips(clips_dir: Path, transcriber: TranscriberModelService, output_filepath: Path, save_every: int=10):
+def get_frame_at(video_reader, time: float) -> Image.Image:
+    """Gets the frame displayed at some time from an opened video.
+
+    Args:
+        video_reader: The imageio reader of the video.
+        time (float): The time, in seconds.
+
+    Returns:
+        Image.Image: The image.
+    """
+
+    frame_index = int(time * video_reader.get_meta_data()['fps'])
+
+    return Image.fromarray(video_reader.get_data(frame_index))
+
+def _load_clip_set_metadata(clips_dir: Path) -> ClipSetMetadata:
+    with open(clips_dir / 'metadata.json', 'r') as f:
+        return ClipSetMetadata.from_json(f.read())
+
+def transcribe_clips(clips_dir: Path, transcriber: TranscriberModelService, output_filepath: Path, save_every: int=10,
+                     audio_track_path: Path | None=None, max_workers: int | None=None, batch_size: int=1,
+                     silence_threshold_db: float | None=None, silent_clips_filepath: Path | None=None,
+                     coalesce_duration: float | None=None, cache: ContentCache | None=None, stop_event: threading.Event | None=None):
+    """Transcribes the audio of each clip.
+
+    Args:
+        clips_dir (Path): The directory of the clips (see `split_video`).
+        transcriber (TranscriberModelService): The ASR model.
+        output_filepath (Path): The JSON file to save the transcriptions to. Transcription resumes from the clips saved in it.
+        save_every (int, optional): The interval (in number of clips) to save the transcriptions. Defaults to 10.
+        audio_track_path (Path | None, optional): The audio track of the source video, extracted by `extract_audio_track`.
+            If given, clips are sliced from it and passed to `TranscriberModelService.call_array`
+            instead of being encoded into audio files. Defaults to None.
+        max_workers (int | None, optional): The number of threads which call the transcriber concurrently.
+            Only use it with transcribers that are thread-safe and latency-bound, e.g., `WhisperCloud`.
+            Transcriptions are still saved in clip order. "None" means transcribing one clip at a time. Defaults to None.
+        batch_size (int, optional): The number of clips passed to `TranscriberModelService.call_batch` at once.
+            Only effective with `audio_track_path`. Defaults to 1.
+        silence_threshold_db (float | None, optional): Clips whose audio is quieter than this (see `detect_silent_clips`)
+            get an empty transcription without calling the transcriber. Only effective with `audio_track_path`.
+            "None" means transcribing all clips. Defaults to None.
+        silent_clips_filepath (Path | None, optional): The JSON file to save the indices of the silent clips to.
+            "None" means not saving them. Defaults to None.
+        coalesce_duration (float | None, optional): The maximum duration (in seconds) of a run of adjacent clips
+            that are transcribed with a single `TranscriberModelService.call_with_timestamps` call.
+            Each segment of the transcription goes to the clip containing its midpoint. Replaces batching.
+            Only effective with `audio_track_path`. "None" means transcribing each clip separately. Defaults to None.
+        cache (ContentCache | None, optional): A cache of transcriptions keyed by audio content, consulted before calling the transcriber.
+            "None" means no caching. Defaults to None.
+        stop_event (threading.Event | None, optional): When set (e.g., by another thread), no more clips are transcribed,
+            and the transcriptions so far are saved. Defaults to None.
+    """
+
+    assert batch_size >= 1, f'batch_size must be positive, but got {batch_size}!'
+
+    if cache is not None:
+        transcriber = CachedTranscriberModelService(transcriber, cache)
+
     try:
         output_filepath.touch()
         with open(output_filepath, 'r') as f:
@@ -153,37 +808,196 @@ def transcribe_clips(clips_dir: Path, transcriber: TranscriberModelService, outp
         output_filepath.touch()
         transcriptions = []
     
-    with open(clips_dir / 'metadata.json', 'r') as f:
-        clip_paths: List[str] = [str(item.path) for item in ClipSetMetadata.from_json(f.read()).clips_metadata]
+    clip_set_metadata = _load_clip_set_metadata(clips_dir)
+    clips_metadata = clip_set_metadata.clips_metadata
     
-    progress = tqdm(list(enumerate(clip_paths)))
+    audio_track = PcmAudioTrack(audio_track_path) if audio_track_path is not None else None
     
-    def flush():
-        with open(output_filepath, 'w') as f:
-            f.write(json.dumps(transcriptions, indent=4, ensure_ascii=False))
-
-    for i, clip_path in progress:
-        if i < len(transcriptions):
-            continue
+    # virtual clips share the audio track of the source video, which is opened only once
+    if audio_track is None and clip_set_metadata.source_video_path is not None:
+        source_audio = AudioFileClip(str(clip_set_metadata.source_video_path))
+    else:
+        source_audio = None
+    
+    # the reader of `source_audio` cannot be shared by threads
+    source_audio_lock = threading.Lock()
+    
+    # energy-based pre-pass over all clips; silent clips are not sent to the transcriber
+    if audio_track is not None and silence_threshold_db is not None:
+        is_silent = detect_silent_clips(audio_track, [c.clip_range for c in clips_metadata], threshold_db=silence_threshold_db)
+        silent_clips = set(int(i) for i in np.flatnonzero(is_silent))
+        logging.info(f'{len(silent_clips)} of {len(clips_metadata)} clips are silent and will not be transcribed.')
+        
+        if silent_clips_filepath is not None:
+            with open(silent_clips_filepath, 'w') as f:
+                f.write(json.dumps(sorted(silent_clips), indent=4))
+    else:
+        silent_clips = set()
+    
+    def transcribe_clip(i: int, clip_metadata: ClipMetaData) -> str:
+        if i in silent_clips:
+            return ''
         
         try:
-            with VideoFileClip(str(clips_dir / clip_path)) as clip:
-                clip.audio.write_audiofile(str(TMP_AUDIO_PATH))
+            if audio_track is not None:
+                return transcriber.call_array(audio_track.slice(clip_metadata.clip_range), audio_track.sampling_rate)
+            
+            # each clip has its own audio file, so that clips can be transcribed concurrently
+            fd, audio_path = tempfile.mkstemp(suffix='.mp3')
+            os.close(fd)
+            
+            try:
+                if clip_metadata.path is None:
+                    with source_audio_lock:
+                        source_audio.subclip(*clip_metadata.clip_range).write_audiofile(audio_path, logger=None)
+                else:
+                    with VideoFileClip(str(clips_dir / clip_metadata.path)) as clip:
+                        clip.audio.write_audiofile(audio_path, logger=None)
                 
-            text = transcriber(TMP_AUDIO_PATH)
+                return transcriber(Path(audio_path))
+            finally:
+                os.remove(audio_path)
         except Exception as e:
-            logging.warning(f'Failed to transcribe clip {i}: {e}; setting transcription to empty string. Clip duration: {clip.duration}.')
-            text = ''
-
+            logging.warning(f'Failed to transcribe clip {i}: {e}; setting transcription to empty string. Clip duration: {clip_metadata.duration}.')
+            return ''
+    
+    def transcribe_batch(batch: List[Tuple[int, ClipMetaData]]) -> List[str]:
+        voiced_batch = [(i, clip_metadata) for i, clip_metadata in batch if i not in silent_clips]
+        
+        if len(voiced_batch) <= 1 or audio_track is None:
+            return [transcribe_clip(i, clip_metadata) for i, clip_metadata in batch]
+        
+        try:
+            voiced_texts = transcriber.call_batch([audio_track.slice(clip_metadata.clip_range) for _, clip_metadata in voiced_batch],
+                                                  audio_track.sampling_rate)
+        except Exception as e:
+            logging.warning(f'Failed to transcribe clips {batch[0][0]}-{batch[-1][0]} as a batch: {e}; transcribing them one by one.')
+            return [transcribe_clip(i, clip_metadata) for i, clip_metadata in batch]
+        
+        texts = dict(zip([i for i, _ in voiced_batch], voiced_texts))
+        return [texts.get(i, '') for i, _ in batch]
+    
+    def transcribe_run(run: List[Tuple[int, ClipMetaData]]) -> List[str]:
+        if len(run) == 1:
+            return [transcribe_clip(*run[0])]
+        
+        run_start = run[0][1].clip_range[0]
+        run_range = (run_start, run[-1][1].clip_range[1])
+        
+        try:
+            segments = transcriber.call_with_timestamps(audio_track.slice(run_range), audio_track.sampling_rate)
+        except Exception as e:
+            logging.warning(f'Failed to transcribe clips {run[0][0]}-{run[-1][0]} together: {e}; transcribing them one by one.')
+            return [transcribe_clip(i, clip_metadata) for i, clip_metadata in run]
+        
+        # clip starts relative to the start of the run
+        clip_starts = np.array([clip_metadata.clip_range[0] - run_start for _, clip_metadata in run])
+        clip_texts: List[List[str]] = [[] for _ in run]
+        
+        for start, end, text in segments:
+            k = max(0, int(np.searchsorted(clip_starts, (start + end) / 2, side='right')) - 1)
+            
+            if text.strip():
+                clip_texts[k].append(text.strip())
+        
+        return ['\n'.join(texts) for texts in clip_texts]
+    
+    progress = tqdm(total=len(clips_metadata), initial=len(transcriptions))
+    
+    def flush():
+        with open(output_filepath, 'w') as f:
+            f.write(json.dumps(transcriptions, indent=4, ensure_ascii=False))
+    
+    def add_transcription(text: str):
         transcriptions.append(text)
-        progress.set_description(f'clip {i + 1}/{len(clip_paths)}: {text}')
+        progress.update()
+        progress.set_description(f'clip {len(transcriptions)}/{len(clips_metadata)}: {text}')
         
-        if (i + 1) % save_every == 0:
+        if len(transcriptions) % save_every == 0:
             flush()
     
+    remaining_clips = list(enumerate(clips_metadata))[len(transcriptions):]
+    
+    # each unit of work is a batch of clips or a run of adjacent clips
+    if coalesce_duration is not None and audio_track is not None:
+        units: List[List[Tuple[int, ClipMetaData]]] = []
+        
+        for i, clip_metadata in remaining_clips:
+            # silent clips are neither transcribed nor sent with the others
+            can_extend = (len(units) > 0 and units[-1][0][0] not in silent_clips and i not in silent_clips
+                          and clip_metadata.clip_range[1] - units[-1][0][1].clip_range[0] <= coalesce_duration)
+            
+            if can_extend:
+                units[-1].append((i, clip_metadata))
+            else:
+                units.append([(i, clip_metadata)])
+        
+        transcribe_unit = transcribe_run
+    else:
+        units = [remaining_clips[i:i + batch_size] for i in range(0, len(remaining_clips), batch_size)]
+        transcribe_unit = transcribe_batch
+    
+    def should_stop() -> bool:
+        return stop_event is not None and stop_event.is_set()
+    
+    if max_workers is None:
+        for unit in units:
+            if should_stop():
+                break
+            
+            for text in transcribe_unit(unit):
+                add_transcription(text)
+    else:
+        # results are collected in clip order, so that the saved transcriptions are always a prefix of all transcriptions;
+        # the number of units submitted ahead of the oldest unfinished one is bounded
+        pending: Deque[Future] = deque()
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for unit in units:
+                if should_stop():
+                    break
+                
+                if len(pending) >= 2 * max_workers:
+                    for text in pending.popleft().result():
+                        add_transcription(text)
+                
+                pending.append(executor.submit(transcribe_unit, unit))
+            
+            while len(pending) > 0:
+                for text in pending.popleft().result():
+                    add_transcription(text)
+    
+    progress.close()
     flush()
+    
+    if source_audio is not None:
+        source_audio.close()
+
+def describe_clips_screenshots(clips_dir: Path, captioner: ImageToTextModelService, output_filepath: Path, save_every: int=10,
+                               batch_size: int=1, cache: ContentCache | None=None, dedupe_max_distance: int | None=None,
+                               stop_event: threading.Event | None=None):
+    """Generates a description of a frame of each clip.
+
+    Args:
+        clips_dir (Path): The directory of the clips (see `split_video`).
+        captioner (ImageToTextModelService): The image captioning model.
+        output_filepath (Path): The JSON file to save the captions to. Captioning resumes from the clips saved in it.
+        save_every (int, optional): The interval (in number of clips) to save the captions. Defaults to 10.
+        batch_size (int, optional): The number of images passed to `ImageToTextModelService.call_batch` at once. Defaults to 1.
+        cache (ContentCache | None, optional): A cache of captions keyed by image pixels, consulted before calling the captioner.
+            "None" means no caching. Defaults to None.
+        dedupe_max_distance (int | None, optional): Frames whose perceptual hashes (64-bit `dhash`) differ in at most this many bits
+            are considered the same, and only the first of them is captioned (see `group_near_duplicates`), e.g., 4.
+            "None" means captioning every frame. Defaults to None.
+        stop_event (threading.Event | None, optional): When set (e.g., by another thread), no more frames are captioned,
+            and the captions so far are saved. Defaults to None.
+    """
+
+    assert batch_size >= 1, f'batch_size must be positive, but got {batch_size}!'
+
+    if cache is not None:
+        captioner = CachedImageToTextModelService(captioner, cache)
 
-def describe_clips_screenshots(clips_dir: Path, captioner: ImageToTextModelService, output_filepath: Path, save_every: int=10):
     try:
         output_filepath.touch()
         with open(output_filepath, 'r') as f:
@@ -193,51 +1007,160 @@ def describe_clips_screenshots(clips_dir: Path, captioner: ImageToTextModelServi
     except Exception:
         captions = []
     
-    with open(clips_dir / 'metadata.json', 'r') as f:
-        clip_paths: List[str] = [str(item.path) for item in ClipSetMetadata.from_json(f.read()).clips_metadata]
+    clip_set_metadata = _load_clip_set_metadata(clips_dir)
+    clips_metadata = clip_set_metadata.clips_metadata
+    
+    # frames of virtual clips without representative frames are read from the source video, which is opened only once
+    needs_source_reader = any(c.path is None and len(c.representative_frames) == 0 for c in clips_metadata)
+    source_reader = imageio.get_reader(clip_set_metadata.source_video_path) if needs_source_reader else None
     
-    progress = tqdm(list(enumerate(clip_paths)))
+    def load_image(clip_metadata: ClipMetaData) -> Image.Image:
+        if len(clip_metadata.representative_frames) > 0:
+            with Image.open(clips_dir / clip_metadata.representative_frames[0]) as frame:
+                return frame.convert('RGB')
+        elif clip_metadata.path is None:
+            return get_frame_at(source_reader, clip_metadata.clip_range[0])
+        else:
+            return get_arbitrary_image(clips_dir / clip_metadata.path)
+    
+    # each clip shares the caption of the first clip of its group (itself without deduplication)
+    if dedupe_max_distance is not None:
+        hashes = []
+        flat = []
+        for clip_metadata in tqdm(clips_metadata, desc='hashing frames'):
+            image = load_image(clip_metadata)
+            hashes.append(dhash(image))
+            flat.append(is_flat(image))
+
+        # flat frames (e.g., black, white, or solid-colour ones) all hash to 0 whatever their colour, so they are never deduplicated
+        group_heads = group_near_duplicates(hashes, dedupe_max_distance, ungrouped=flat)
+        logging.info(f'{len(set(group_heads))} of {len(clips_metadata)} frames are distinct.')
+    else:
+        group_heads = list(range(len(clips_metadata)))
+    
+    # captions of the group heads; when resuming, the head of each captioned clip has been captioned
+    group_captions = {group_heads[i]: captions[group_heads[i]] for i in range(len(captions))}
+    heads_to_caption = [i for i in range(len(captions), len(clips_metadata)) if group_heads[i] == i]
+    
+    progress = tqdm(total=len(clips_metadata), initial=len(captions))
     
     def flush():
         with open(output_filepath, 'w') as f:
             f.write(json.dumps(captions, indent=4))
 
-    for i, clip_path in progress:
-        if i < len(captions):
-            continue
-        
-        image = get_arbitrary_image(clips_dir / clip_path)
-        caption = captioner(image)
-        captions.append(caption)
-        progress.set_description(f'clip {i + 1}/{len(clip_paths)}: {caption}')
+    def append_known_captions():
+        # heads are captioned in clip order, so the captions are always saved as a prefix
+        while len(captions) < len(clips_metadata) and group_heads[len(captions)] in group_captions:
+            caption = group_captions[group_heads[len(captions)]]
+            captions.append(caption)
+            progress.update()
+            progress.set_description(f'clip {len(captions)}/{len(clips_metadata)}: {caption}')
+            
+            if len(captions) % save_every == 0:
+                flush()
+
+    # when resuming, the next clips may share the captions of heads captioned before
+    append_known_captions()
+
+    for batch_start in range(0, len(heads_to_caption), batch_size):
+        if stop_event is not None and stop_event.is_set():
+            break
         
-        if (i + 1) % save_every == 0:
-            flush()
+        batch = heads_to_caption[batch_start:batch_start + batch_size]
+        images = [load_image(clips_metadata[i]) for i in batch]
+
+        batch_captions = [captioner(images[0])] if len(images) == 1 else captioner.call_batch(images)
+        group_captions.update(zip(batch, batch_captions))
+
+        append_known_captions()
     
+    progress.close()
     flush()
+    
+    if source_reader is not None:
+        source_reader.close()
 
 def parse_video_clips(clips_dir: Path,
                       transcriber_instantiator: Callable[[], TranscriberModelService],
                       image_describer_instantiator: Callable[[], ImageToTextModelService],
                       transcriptions_file: Path,
                       screenshot_descriptions_file: Path,
-                      save_every: int=10):
-    # transcribe clips
-    logging.info('Transcribing clips...')
-    transcriber = transcriber_instantiator()
-    transcribe_clips(clips_dir, transcriber, transcriptions_file, save_every)
+                      save_every: int=10,
+                      audio_track_path: Path | None=None,
+                      transcription_workers: int | None=None,
+                      inference_batch_size: int=1,
+                      silence_threshold_db: float | None=None,
+                      silent_clips_file: Path | None=None,
+                      transcription_coalesce_duration: float | None=None,
+                      inference_cache: ContentCache | None=None,
+                      caption_dedupe_max_distance: int | None=None,
+                      concurrent_stages: bool=True):
+    # set when a stage fails, so that the other (concurrent) stage stops instead of running to the end
+    stop_event = threading.Event()
+
+    def transcription_stage():
+        logging.info('Transcribing clips...')
+        transcriber = transcriber_instantiator()
+        transcribe_clips(clips_dir, transcriber, transcriptions_file, save_every, audio_track_path=audio_track_path,
+                         max_workers=transcription_workers, batch_size=inference_batch_size,
+                         silence_threshold_db=silence_threshold_db, silent_clips_filepath=silent_clips_file,
+                         coalesce_duration=transcription_coalesce_duration, cache=inference_cache, stop_event=stop_event)
 
-    # create screenshot descriptions for clips
-    logging.info('Creating screenshot descriptions for clips...')
-    captioner = image_describer_instantiator()
-    describe_clips_screenshots(clips_dir, captioner, screenshot_descriptions_file, save_every)
+    def captioning_stage():
+        logging.info('Creating screenshot descriptions for clips...')
+        captioner = image_describer_instantiator()
+        describe_clips_screenshots(clips_dir, captioner, screenshot_descriptions_file, save_every, batch_size=inference_batch_size,
+                                   cache=inference_cache, dedupe_max_distance=caption_dedupe_max_distance, stop_event=stop_event)
+
+    def run_stage(stage: Callable[[], None]):
+        try:
+            stage()
+        except BaseException:
+            stop_event.set()
+            raise
+
+    if concurrent_stages:
+        # cloud ASR mostly waits on the network while captioning mostly computes,
+        # so transcription runs in another thread while captioning runs in this one
+        errors: List[Exception] = []
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            transcription_future = executor.submit(run_stage, transcription_stage)
+
+            try:
+                run_stage(captioning_stage)
+            except Exception as e:
+                errors.append(e)
+
+            # the transcription stage stops early if captioning failed; its own error must not be lost either
+            try:
+                transcription_future.result()
+            except Exception as e:
+                errors.append(e)
+
+        if len(errors) == 1:
+            raise errors[0]
+        elif len(errors) > 1:
+            raise ExceptionGroup('Both the captioning and the transcription stages failed', errors)
+    else:
+        transcription_stage()
+        captioning_stage()
 
 def compile_video_for_llm(video_path: Path,
                           output_dir: Path,
                           transcriber_instantiator: Callable[[], TranscriberModelService],
                           image_describer_instantiator: Callable[[], ImageToTextModelService],
                           rtol: float=0.4,
-                          save_every: int=10) -> None:
+                          save_every: int=10,
+                          split_mode: str=SplitModes.REENCODE,
+                          split_extra_arguments: Dict[str, Any]={},
+                          transcription_workers: int | None=None,
+                          inference_batch_size: int=1,
+                          silence_threshold_db: float | None=None,
+                          transcription_coalesce_duration: float | None=None,
+                          inference_cache: ContentCache | None=None,
+                          caption_dedupe_max_distance: int | None=None,
+                          concurrent_stages: bool=True) -> None:
     """Compiles LLM-feedable data from a video. Steps include:
     
     1. Split the video into clips;
@@ -251,8 +1174,12 @@ def compile_video_for_llm(video_path: Path,
             1.mp4 - clip 1
             2.mp4 - clip 2
             ...
+            (in "virtual" split mode, `clips/` contains `metadata.json` only)
             
+        frame_differences.npz: the frame differences of the video (kept when `clips/` is deleted to re-split the video with another `rtol`)
+        audio.f32: the audio track of the video, as raw 16 kHz mono float32 PCM (clips are sliced from it for transcription)
         transcriptions.json: the transcription of the clips
+        silent_clips.json: the indices of the clips that were found silent and not transcribed
         captions.json: the captions of arbitrary screenshots fromthe clips
 
     Args:
@@ -261,6 +1188,25 @@ def compile_video_for_llm(video_path: Path,
         transcriber_instantiator (Callable[[], TranscriberModelService]): The return value is used as the ASR model for audio transcription.
         image_describer_instantiator (Callable[[], ImageToTextModelService]): The return value is used as the model for image captioning.
         rtol (float): `rtol` for image splitting.
+        save_every (int): The interval (in number of clips) to save the transcriptions and captions.
+        split_mode (str): How the clips are produced. One of the values in `SplitModes`.
+            In "virtual" mode, no clip files are produced and the clips are read directly from `video_path`.
+        split_extra_arguments (Dict[str, Any]): Extra named arguments to pass to `split_video`, e.g., `encoding_workers`.
+        transcription_workers (int | None): The number of clips transcribed concurrently (see `transcribe_clips`).
+            "None" means transcribing one clip at a time.
+        inference_batch_size (int): The number of clips passed to the transcriber and the captioner at once.
+            Batching speeds up local models such as `Whisper` and `BlipLarge`.
+        silence_threshold_db (float | None): Clips quieter than this (in dB relative to full scale) are not transcribed
+            (see `detect_silent_clips`), e.g., `DEFAULT_SILENCE_THRESHOLD_DB`; their transcriptions are empty.
+            "None" means transcribing all clips.
+        transcription_coalesce_duration (float | None): The maximum duration (in seconds) of a run of adjacent clips
+            transcribed with a single request, e.g., 30 (see `transcribe_clips`). "None" means one request per clip.
+        inference_cache (ContentCache | None): A cache of transcriptions and captions keyed by audio samples and frame pixels,
+            which can be shared by the videos of a series (e.g., for their opening and ending). "None" means no caching.
+        caption_dedupe_max_distance (int | None): Clips whose frames are near-duplicates (perceptual hashes within this Hamming distance)
+            share one caption, e.g., 4 (see `describe_clips_screenshots`). "None" means captioning every frame.
+        concurrent_stages (bool): Whether to transcribe and caption the clips at the same time (on separate threads).
+            Disable it if both models compete for the same device, e.g., local models on a small GPU.
     """
     
     if not output_dir.exists():
@@ -269,15 +1215,26 @@ def compile_video_for_llm(video_path: Path,
     clips_dir = output_dir / 'clips'
     
     if not (clips_dir.exists() and (clips_dir / 'metadata.json').exists()):
-        if clips_dir.exists():
-            shutil.rmtree(clips_dir)
-
-        # split video into clips
+        # split video into clips, resuming from where an interrupted split stopped (if any)
         logging.info(f'Splitting video: {video_path}')
-        split_video(video_path, clips_dir, rtol=rtol)
+        split_video(video_path, clips_dir, rtol=rtol, mode=split_mode, frame_differences_path=output_dir / 'frame_differences.npz',
+                    resume=True, **split_extra_arguments)
         logging.info(f'Video clips saved to {clips_dir}.')
 
+    # decode the audio track once for all clips
+    audio_track_path = output_dir / 'audio.f32'
+    if not audio_track_path.exists():
+        try:
+            extract_audio_track(video_path, audio_track_path)
+        except subprocess.CalledProcessError as e:
+            logging.warning(f'Failed to extract the audio track of {video_path}: {e}; audio will be read from the clips.')
+            audio_track_path = None
+
     # ASR & image captioning
     parse_video_clips(clips_dir, transcriber_instantiator, image_describer_instantiator,
                       output_dir / 'transcriptions.json', output_dir / 'captions.json',
-                      save_every=save_every)
+                      save_every=save_every, audio_track_path=audio_track_path, transcription_workers=transcription_workers,
+                      inference_batch_size=inference_batch_size, silence_threshold_db=silence_threshold_db,
+                      silent_clips_file=output_dir / 'silent_clips.json',
+                      transcription_coalesce_duration=transcription_coalesce_duration, inference_cache=inference_cache,
+                      caption_dedupe_max_distance=caption_dedupe_max_distance, concurrent_stages=concurrent_stages)